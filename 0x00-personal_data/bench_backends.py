@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the regex and tokens redaction backends across field counts
+and message sizes
+"""
+import random
+import timeit
+from typing import List
+
+from filtered_logger import REDACTION_BACKENDS, RedactingFormatter
+
+FIELD_COUNTS = (5, 20, 50, 200)
+MESSAGE_SIZES = (100, 1024, 8 * 1024, 64 * 1024)
+
+
+def make_fields(count: int) -> List[str]:
+    """
+    Return count field names to redact
+    """
+    return ["field_{}".format(i) for i in range(count)]
+
+
+def make_message(fields: List[str], size: int) -> str:
+    """
+    Build a message of about size bytes where one token in three is a
+    field to redact
+    """
+    tokens = []
+    length = 0
+    i = 0
+    while length < size:
+        if i % 3 == 0:
+            key = fields[(i // 3) % len(fields)]
+        else:
+            key = "extra_{}".format(i)
+        token = "{}=value-{}".format(key, i)
+        tokens.append(token)
+        length += len(token) + 2
+        i += 1
+    return "; ".join(tokens) + ";"
+
+
+# (fields, message, separator) where a field is not a whole token key
+CASES = (
+    (["name"], "username=bob;", ";"),
+    (["name"], "user_agent=Mozilla name=foo; name=bar;", ";"),
+    (["name", "email"], "x=a=b;email=;name", ";"),
+    (["a", "b"], "b=a=;b=x=y;=;a", ";"),
+    (["name"], "name=bob; email=x; name=y", "; "),
+    (["na;me", "x=y"], "na;me=1;x=y=2;", ";"),
+)
+
+
+def check_agreement(count: int, seed: int = 0) -> None:
+    """
+    Check the backends give the same output on CASES and on count random
+    messages of short field names, "=", separators and spaces
+    """
+    rng = random.Random(seed)
+    cases = list(CASES)
+    for _ in range(count):
+        separator = rng.choice((';', ';', ',', '; '))
+        fields = [''.join(rng.choice('abn') for _ in range(rng.randint(
+            0, 3))) for _ in range(rng.randint(1, 4))]
+        message = ''.join(rng.choice('abn= ' + separator)
+                          for _ in range(rng.randint(0, 24)))
+        cases.append((fields, message, separator))
+    for fields, message, separator in cases:
+        outputs = {func(fields, '***', message, separator)
+                   for func in REDACTION_BACKENDS.values()}
+        assert len(outputs) == 1, (fields, message, separator)
+
+
+def main() -> None:
+    """
+    Check both backends agree then print the time of one call of each
+    """
+    check_agreement(50000)
+    redaction = RedactingFormatter.REDACTION
+    separator = RedactingFormatter.SEPARATOR
+    print("{:>6} {:>7} {:>12} {:>12}  winner".format(
+        "fields", "bytes", "regex us", "tokens us"))
+    for count in FIELD_COUNTS:
+        fields = make_fields(count)
+        for size in MESSAGE_SIZES:
+            message = make_message(fields, size)
+            outputs = set()
+            timings = {}
+            number = max(2000000 // size, 20)
+            for name, func in REDACTION_BACKENDS.items():
+                outputs.add(func(fields, redaction, message, separator))
+                total = timeit.timeit(
+                    lambda: func(fields, redaction, message, separator),
+                    number=number)
+                timings[name] = total / number * 1e6
+            assert len(outputs) == 1, "backends disagree"
+            print("{:>6} {:>7} {:>12.2f} {:>12.2f}  {}".format(
+                count, len(message), timings["regex"], timings["tokens"],
+                min(timings, key=timings.get)))
+
+
+if __name__ == "__main__":
+    main()
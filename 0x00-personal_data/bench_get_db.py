@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Benchmark of opening a connection per call with get_db against checking
+one out of the pool with get_pooled_db. Needs a reachable MySQL/MariaDB
+configured through the PERSONAL_DATA_DB_* environment variables.
+"""
+import sys
+import time
+from typing import Callable
+
+from filtered_logger import get_db, get_pooled_db
+
+CALLS = 500
+
+
+def bench(connect: Callable, calls: int) -> float:
+    """
+    Return the mean time in milliseconds of connect, one query and close
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        db = connect()
+        cursor = db.cursor()
+        cursor.execute("SELECT 1;")
+        cursor.fetchall()
+        cursor.close()
+        db.close()
+    return (time.perf_counter() - start) / calls * 1e3
+
+
+def main() -> None:
+    """
+    Print the per call cost of both strategies
+    """
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else CALLS
+    per_call = bench(get_db, calls)
+    pooled = bench(get_pooled_db, calls)
+    print("connect per call {:8.3f} ms".format(per_call))
+    print("pooled           {:8.3f} ms  x{:.1f}".format(pooled,
+                                                        per_call / pooled))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark of hash_passwords and verify_many at 1, 2, 4 and 8
+workers
+"""
+import sys
+import time
+
+from encrypt_password import hash_passwords, verify_many
+
+WORKERS = (1, 2, 4, 8)
+COUNT = 64
+
+
+def main() -> None:
+    """
+    Print hashes/s and verifications/s for every worker count
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COUNT
+    passwords = ["MyAmazingPassw0rd{}".format(i) for i in range(count)]
+    for workers in WORKERS:
+        start = time.perf_counter()
+        hashes = hash_passwords(passwords, workers)
+        hashing = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = verify_many(zip(hashes, passwords), workers)
+        verifying = time.perf_counter() - start
+        assert all(results), "a password did not verify"
+
+        print("{} workers  {:7.1f} hash/s  {:7.1f} verify/s".format(
+            workers, count / hashing, count / verifying))
+
+
+if __name__ == "__main__":
+    main()
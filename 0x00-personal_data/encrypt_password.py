@@ -3,15 +3,83 @@
 Module 0x00-personal_data
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import os
+import threading
+import time
+
 import bcrypt
 
+HASH_WORKERS = os.cpu_count() or 1
+HASH_BUDGET_MS = float(os.getenv('BCRYPT_BUDGET_MS', 100))
+MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', 12))
+MAX_ROUNDS = 31
+
+_target_rounds = None
+_rounds_lock = threading.Lock()
+
+
+def calibrate_rounds(budget_ms: float = HASH_BUDGET_MS,
+                     minimum: int = MIN_ROUNDS) -> int:
+    """
+    Measure bcrypt on this host and return the highest cost whose hash
+    fits in budget_ms, but never less than minimum. Each extra round
+    doubles the time, so the cost goes up while twice the last measured
+    time is still within the budget.
+    """
+    rounds = 4
+    while rounds < MAX_ROUNDS:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1e3
+        if elapsed_ms * 2 > budget_ms:
+            break
+        rounds += 1
+    return max(rounds, minimum)
+
+
+def target_rounds() -> int:
+    """
+    Return the bcrypt cost to hash with: BCRYPT_ROUNDS when it is set,
+    otherwise calibrate_rounds(), measured once per process. Set
+    BCRYPT_ROUNDS to give every worker process the same target.
+    """
+    global _target_rounds
+    with _rounds_lock:
+        if _target_rounds is None:
+            configured = os.getenv('BCRYPT_ROUNDS')
+            _target_rounds = int(configured) if configured \
+                else calibrate_rounds()
+        return _target_rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """
+    Return the cost a bcrypt hash was made with
+    """
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes,
+                 rounds: Optional[int] = None) -> bool:
+    """
+    Tell whether a stored hash was made with a lower cost than rounds
+    (by default the current target) and should be hashed again. A higher
+    cost is kept: rehashing it would weaken the hash.
+    """
+    if rounds is None:
+        rounds = target_rounds()
+    return hash_rounds(hashed_password) < rounds
+
 
 def hash_password(password: str) -> bytes:
     """
     Hash a password using bcrypt
     """
-    # Generate a salt
-    salt = bcrypt.gensalt()
+    # Generate a salt at the calibrated cost
+    salt = bcrypt.gensalt(target_rounds())
 
     # Hash the password
     hashed_password = bcrypt.hashpw(password.encode(), salt)
@@ -24,3 +92,48 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     make sure that password matches the hashed password.
     """
     return bcrypt.checkpw(password.encode(), hashed_password)
+
+
+def verify_password(hashed_password: bytes,
+                    password: str) -> Tuple[bool, bool]:
+    """
+    Check a password and return (valid, needs_rehash): when both are True
+    the caller should store hash_password(password) instead.
+    """
+    valid = is_valid(hashed_password, password)
+    return valid, valid and needs_rehash(hashed_password)
+
+
+def _map_bounded(func: Callable, items: Iterable,
+                 workers: int) -> Iterator:
+    """
+    Yield func(item) for every item, in input order, running on a pool of
+    workers threads (bcrypt releases the GIL) with at most twice that many
+    items in flight, so a long iterable is never read ahead entirely.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def hash_passwords(passwords: Iterable[str],
+                   workers: int = HASH_WORKERS) -> List[bytes]:
+    """
+    Hash many passwords using bcrypt on a thread pool.
+    The hashes are returned in the order of passwords.
+    """
+    return list(_map_bounded(hash_password, passwords, workers))
+
+
+def verify_many(pairs: Iterable[Tuple[bytes, str]],
+                workers: int = HASH_WORKERS) -> List[bool]:
+    """
+    Check many (hashed_password, password) pairs on a thread pool.
+    The results are returned in the order of pairs.
+    """
+    return list(_map_bounded(lambda pair: is_valid(*pair), pairs, workers))
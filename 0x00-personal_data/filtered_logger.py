@@ -3,33 +3,155 @@
 Module 0x00-personal_data
 """
 import re
+import atexit
+import collections
+import itertools
 import logging
-from typing import List
+import queue
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing import Pool
+from typing import (Callable, FrozenSet, Iterator, List, Optional, Pattern,
+                    Tuple, Union)
 import os
+import sys
+import time
 import mysql.connector
-from mysql.connector import connection
+from mysql.connector import connection, pooling
 
 
-def get_db() -> connection.MySQLConnection:
+def _db_config() -> dict:
     """
-    Connect to a secure MySQL database
+    Read the connection settings from the environment
     """
     # Retrieve environment variables with defaults
-    username = os.getenv('PERSONAL_DATA_DB_USERNAME', 'root')
-    password = os.getenv('PERSONAL_DATA_DB_PASSWORD', '')
-    host = os.getenv('PERSONAL_DATA_DB_HOST', 'localhost')
-    database = os.getenv('PERSONAL_DATA_DB_NAME')
+    return {
+        "user": os.getenv('PERSONAL_DATA_DB_USERNAME', 'root'),
+        "password": os.getenv('PERSONAL_DATA_DB_PASSWORD', ''),
+        "host": os.getenv('PERSONAL_DATA_DB_HOST', 'localhost'),
+        "database": os.getenv('PERSONAL_DATA_DB_NAME'),
+    }
+
 
+def get_db() -> connection.MySQLConnection:
+    """
+    Connect to a secure MySQL database
+    """
     # Connect to the MySQL database
-    return mysql.connector.connect(
-        user=username,
-        password=password,
-        host=host,
-        database=database
-    )
+    return mysql.connector.connect(**_db_config())
+
+
+class RecyclingConnectionPool(pooling.MySQLConnectionPool):
+    """ Connection pool that reconnects connections left idle too long"""
+
+    def __init__(self, recycle: float, **kwargs):
+        """
+        Initialize the pool; recycle is the maximum idle time in seconds
+        """
+        self.recycle = recycle
+        self._idle_since = {}
+        super(RecyclingConnectionPool, self).__init__(**kwargs)
+
+    def add_connection(self, cnx=None) -> None:
+        """
+        Give a connection back to the pool and remember when it went idle
+        """
+        if cnx is not None:
+            self._idle_since[cnx.connection_id] = time.monotonic()
+        super(RecyclingConnectionPool, self).add_connection(cnx)
+
+    def get_connection(self) -> pooling.PooledMySQLConnection:
+        """
+        Check out a connection. The base pool already pings it and
+        reconnects a dead one; this also reconnects it when it has been
+        idle for longer than recycle seconds.
+        """
+        cnx = super(RecyclingConnectionPool, self).get_connection()
+        idle_since = self._idle_since.pop(cnx.connection_id, None)
+        if idle_since is not None \
+                and time.monotonic() - idle_since > self.recycle:
+            cnx.reconnect()
+        return cnx
+
+
+_db_pool = None
+
+
+def get_db_pool() -> RecyclingConnectionPool:
+    """
+    Return the process wide connection pool, creating it on first use
+    from the PERSONAL_DATA_DB_* environment variables
+    """
+    global _db_pool
+    if _db_pool is None:
+        _db_pool = RecyclingConnectionPool(
+            recycle=float(os.getenv('PERSONAL_DATA_DB_POOL_RECYCLE', 300)),
+            pool_name="personal_data",
+            pool_size=int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', 5)),
+            **_db_config()
+        )
+    return _db_pool
+
+
+def get_pooled_db() -> pooling.PooledMySQLConnection:
+    """
+    Check out a connection from the pool; close() gives it back
+    """
+    return get_db_pool().get_connection()
 
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+USERS_COLUMNS = ("name", "email", "phone", "ssn", "password", "ip",
+                 "last_login", "user_agent")
+USERS_SELECT = "SELECT {} FROM users".format(", ".join(USERS_COLUMNS))
+USERS_QUERY = USERS_SELECT + ";"
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SHARD_SIZE = 50000
+REDACTION_CACHE_SIZE = 128
+LOG_QUEUE_SIZE = 10000
+OVERFLOW_POLICIES = ("block", "drop-oldest", "count-and-drop")
+
+
+def _plain_fields(fields: Tuple[str, ...], separator: str) -> bool:
+    """
+    Tell whether no field holds a "=" or a character of separator
+    """
+    return not any(char in field for field in fields
+                   for char in separator + '=')
+
+
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _redaction_pattern(fields: Tuple[str, ...],
+                       separator: str) -> Pattern[str]:
+    """
+    Compile (once per fields/separator pair) a regex matching the "=" and
+    the value of every field=value pair. The field names are checked with
+    look-behinds, so the substitution is a literal and re.sub runs no
+    Python code per match; such a match can only start on the "=" after
+    a field name that the alternation of the fields would have matched.
+    Fields holding "=" or a character of separator, where this is not
+    true, match field=value as the original pattern did.
+    """
+    names = [re.escape(field) for field in fields]
+    if not _plain_fields(fields, separator):
+        return re.compile('(?:{})=[^{}]*'.format(
+            '|'.join(names) or '(?!)', re.escape(separator)))
+    return re.compile('=(?:{})[^{}]*'.format(
+        '|'.join(['(?<={}=)'.format(name) for name in names]) or '(?!)',
+        re.escape(separator)))
+
+
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _redaction_replacement(fields: Tuple[str, ...], separator: str,
+                           redaction: str) -> Union[str, Callable]:
+    """
+    Return the re.sub replacement of _redaction_pattern: the "=" and
+    redaction taken literally, or the original callback keeping the
+    field name for the fields that are not plain
+    """
+    if _plain_fields(fields, separator):
+        return '=' + redaction.replace('\\', '\\\\')
+    return lambda match: match.group(0).split('=')[0] + '=' + redaction
 
 
 def filter_datum(fields: List[str], redaction: str, message: str,
@@ -37,9 +159,56 @@ def filter_datum(fields: List[str], redaction: str, message: str,
     """
     Obfuscates specific fields in a log message.
     """
-    pattern = '|'.join([f'{field}=[^{separator}]*' for field in fields])
-    return re.sub(pattern, lambda m: m.group(0).split('=')[0]
-                  + '=' + redaction, message)
+    fields = tuple(fields)
+    return re.sub(_redaction_pattern(fields, separator),
+                  _redaction_replacement(fields, separator, redaction),
+                  message)
+
+
+@lru_cache(maxsize=REDACTION_CACHE_SIZE)
+def _field_set(fields: Tuple[str, ...]) -> Tuple[FrozenSet[str],
+                                                 Tuple[int, ...]]:
+    """
+    Return the fields as a frozenset for constant time lookups, with the
+    distinct lengths of the field names in increasing order
+    """
+    return frozenset(fields), tuple(sorted({len(field) for field in fields}))
+
+
+def filter_datum_tokens(fields: List[str], redaction: str, message: str,
+                        separator: str) -> str:
+    """
+    Obfuscates specific fields in a log message without a regex, with the
+    output of filter_datum: the message is split once on separator and
+    every token is cut after its first "=" that ends a field name (the
+    "name" of "username=" or of "Mozilla name=" too) and given the
+    redaction, each name looked up in a frozenset. A separator of several
+    characters (a character class for the regex) or a field holding "="
+    or the separator falls back to filter_datum.
+    """
+    fields = tuple(fields)
+    if len(separator) != 1 or not _plain_fields(fields, separator):
+        return filter_datum(fields, redaction, message, separator)
+    names, lengths = _field_set(fields)
+    tokens = message.split(separator)
+    for i, token in enumerate(tokens):
+        equal = token.find('=')
+        while equal >= 0:
+            for length in lengths:
+                if length <= equal and token[equal - length:equal] in names:
+                    tokens[i] = token[:equal + 1] + redaction
+                    break
+            else:
+                equal = token.find('=', equal + 1)
+                continue
+            break
+    return separator.join(tokens)
+
+
+REDACTION_BACKENDS = {
+    "regex": filter_datum,
+    "tokens": filter_datum_tokens,
+}
 
 
 class RedactingFormatter(logging.Formatter):
@@ -48,25 +217,110 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], backend: str = "regex"):
         """
         Initialize the formatter.
+        backend selects the redaction function in REDACTION_BACKENDS.
         """
         super(RedactingFormatter, self).__init__(self.FORMAT)
+        if backend not in REDACTION_BACKENDS:
+            raise ValueError(f"unknown redaction backend {backend}")
         self.fields = fields
+        self.redact = REDACTION_BACKENDS[backend]
 
     def format(self, record: logging.LogRecord) -> str:
         """
-        Format the log record
+        Format the log record. Records logged with extra={"redacted": True}
+        are already redacted and are not scanned again.
         """
-        record.msg = filter_datum(self.fields, self.REDACTION,
-                                  record.msg, self.SEPARATOR)
+        if not getattr(record, "redacted", False):
+            record.msg = self.redact(self.fields, self.REDACTION,
+                                     record.msg, self.SEPARATOR)
         return super(RedactingFormatter, self).format(record)
 
 
-def get_logger() -> logging.Logger:
+class BoundedQueueHandler(QueueHandler):
+    """ QueueHandler on a bounded queue with an overflow policy"""
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = "block"):
+        """
+        Initialize the handler. overflow is what happens when the queue is
+        full: "block" waits for room, "drop-oldest" discards the oldest
+        queued record and "count-and-drop" discards the new one; dropped
+        records are counted in self.dropped.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {overflow}")
+        super(BoundedQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Queue the record untouched: redaction and formatting run on the
+        listener thread, not on the caller's
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        Put the record on the queue following the overflow policy
+        """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.overflow == "count-and-drop":
+                    return
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+
+    def close(self) -> None:
+        """
+        Stop the listener, writing out every record still queued
+        """
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super(BoundedQueueHandler, self).close()
+
+
+class FlushingQueueListener(QueueListener):
+    """ QueueListener that can always be stopped, even on a full queue"""
+
+    def enqueue_sentinel(self) -> None:
+        """
+        Wait for room for the stop sentinel instead of failing
+        """
+        self.queue.put(self._sentinel)
+
+
+def _handler_mode(handler: logging.Handler) -> tuple:
+    """
+    Return the get_logger() arguments a handler was added with
+    """
+    if isinstance(handler, BoundedQueueHandler):
+        return (True, handler.queue.maxsize, handler.overflow)
+    return (False,)
+
+
+def get_logger(queued: bool = False, queue_size: int = LOG_QUEUE_SIZE,
+               overflow: str = "block") -> logging.Logger:
     """
     Creates a logger with PII filtering.
+    With queued, records go through a bounded queue to a background
+    listener thread that redacts and writes them; see BoundedQueueHandler
+    for the overflow policies. The handler is added on the first call and
+    replaced (the records queued so far written out) by a call asking for
+    another mode; close_logger() flushes and removes it.
 
     Returns:
         logging.Logger: Configured logger object
@@ -74,47 +328,346 @@ def get_logger() -> logging.Logger:
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
+    mode = (True, queue_size, overflow) if queued else (False,)
+    if logger.handlers and all(_handler_mode(handler) == mode
+                               for handler in logger.handlers):
+        return logger
 
     # Create a StreamHandler
     stream_handler = logging.StreamHandler()
     formatter = RedactingFormatter(fields=PII_FIELDS)
     stream_handler.setFormatter(formatter)
+    handler = stream_handler
 
-    # Adding handler to the logger
-    logger.addHandler(stream_handler)
+    if queued:
+        # Queue the records, the listener thread formats and writes them
+        log_queue = queue.Queue(queue_size)
+        handler = BoundedQueueHandler(log_queue, overflow)
+        handler.listener = FlushingQueueListener(log_queue, stream_handler)
+
+    # Adding handler to the logger, in place of one of another mode
+    close_logger(logger)
+    if queued:
+        handler.listener.start()
+        atexit.register(handler.close)
+    logger.addHandler(handler)
 
     return logger
 
 
+def close_logger(logger: logging.Logger) -> None:
+    """
+    Flush and remove the handlers added by get_logger
+    """
+    for handler in list(logger.handlers):
+        handler.flush()
+        handler.close()
+        logger.removeHandler(handler)
+
+
+class RowRedactor:
+    """ Redacts database rows by column position instead of by regex"""
+
+    def __init__(self, columns: Tuple[str, ...],
+                 fields: Tuple[str, ...] = PII_FIELDS,
+                 redaction: str = RedactingFormatter.REDACTION):
+        """
+        Initialize the redactor for rows whose columns are named columns.
+        The key=value message is compiled once into a format template
+        where the fields are already replaced by redaction. A column
+        whose name ends with a field ("username" for "name") is replaced
+        too, as filter_datum would.
+        """
+        self.columns = tuple(columns)
+        self.fields = tuple(fields)
+        self.redaction = redaction
+        pattern = _redaction_pattern(self.fields, RedactingFormatter.SEPARATOR)
+        self.positions = frozenset(i for i, column in enumerate(columns)
+                                   if pattern.search(column + '='))
+        self.kept = tuple(i for i in range(len(columns))
+                          if i not in self.positions)
+        parts = []
+        for i, column in enumerate(columns):
+            value = redaction.replace('{', '{{').replace('}', '}}') \
+                if i in self.positions else '{}'
+            parts.append(column.replace('{', '{{').replace('}', '}}')
+                         + '=' + value + RedactingFormatter.SEPARATOR)
+        self.template = ' '.join(parts)
+
+    def redact(self, row: tuple) -> tuple:
+        """
+        Return a copy of row with the fields replaced by the redaction
+        """
+        return tuple(self.redaction if i in self.positions else value
+                     for i, value in enumerate(row))
+
+    def format(self, row: tuple) -> str:
+        """
+        Format row as a redacted key=value log message in a single pass.
+        The other columns give the same text as RedactingFormatter: a
+        field=value inside them (a "name=x" in user_agent) is redacted
+        by filter_datum, which only runs on the values holding a "=".
+        A field whose value holds the separator is replaced whole, where
+        RedactingFormatter stops at the separator and logs the rest.
+        """
+        values = []
+        for i in self.kept:
+            value = str(row[i])
+            if '=' in value:
+                value = filter_datum(self.fields, self.redaction, value,
+                                     RedactingFormatter.SEPARATOR)
+            values.append(value)
+        return self.template.format(*values)
+
+
+def stream_rows(db: connection.MySQLConnection,
+                batch_size: int = EXPORT_BATCH_SIZE,
+                query: str = USERS_QUERY,
+                params: tuple = ()) -> Iterator[tuple]:
+    """
+    Yield the rows of the users table, fetching batch_size rows at a time
+    from an unbuffered cursor so only one batch is held in memory.
+    """
+    cursor = db.cursor(buffered=False)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def format_row(row: tuple) -> str:
+    """
+    Format a users row as a key=value log message
+    """
+    return "".join([f"{column}={value}; " for column, value
+                    in zip(USERS_COLUMNS, row)]).rstrip(" ")
+
+
+def stream_redacted_lines(db: connection.MySQLConnection,
+                          batch_size: int = EXPORT_BATCH_SIZE
+                          ) -> Iterator[str]:
+    """
+    Yield the redacted log message of every row of the users table
+    """
+    redactor = RowRedactor(USERS_COLUMNS)
+    for row in stream_rows(db, batch_size):
+        yield redactor.format(row)
+
+
+def masked_users_query(fields: Tuple[str, ...] = PII_FIELDS,
+                       redaction: str = RedactingFormatter.REDACTION
+                       ) -> Tuple[str, tuple]:
+    """
+    Build a (query, params) SELECT of the users table where the server
+    replaces every column in fields by the redaction constant, so those
+    values are never sent to the client.
+    """
+    columns = []
+    params = []
+    for column in USERS_COLUMNS:
+        if column in fields:
+            columns.append(f"%s AS {column}")
+            params.append(redaction)
+        else:
+            columns.append(column)
+    return "SELECT {} FROM users;".format(", ".join(columns)), tuple(params)
+
+
+def stream_masked_lines(db: connection.MySQLConnection,
+                        batch_size: int = EXPORT_BATCH_SIZE
+                        ) -> Iterator[str]:
+    """
+    Yield the log message of every row of the users table, masked by the
+    server: the lines equal stream_redacted_lines, the PII values never
+    reaching the client
+    """
+    query, params = masked_users_query()
+    redactor = RowRedactor(USERS_COLUMNS)
+    for row in stream_rows(db, batch_size, query, params):
+        yield redactor.format(row)
+
+
+def _shard_queries(db: connection.MySQLConnection, shard_size: int,
+                   key: Optional[str] = None) -> List[Tuple[str, tuple]]:
+    """
+    Split the users table into (query, params) ranges of about shard_size
+    rows: ranges of the numeric primary key when key is given, LIMIT/OFFSET
+    ranges otherwise. Every LIMIT/OFFSET range sorts the whole table on
+    all its columns, so a keyless export does more work with every shard,
+    and its order is that sort, not the order of the rows in the table.
+    """
+    cursor = db.cursor()
+    if key is None:
+        cursor.execute("SELECT COUNT(*) FROM users;")
+        total, = cursor.fetchone()
+        cursor.close()
+        # the table has no key: order by every column so each connection
+        # sees the same row order and the ranges neither overlap nor miss
+        # rows (rows sorting equal are identical lines)
+        query = USERS_SELECT + " ORDER BY {} LIMIT %s OFFSET %s;".format(
+            ", ".join(USERS_COLUMNS))
+        return [(query, (shard_size, offset))
+                for offset in range(0, total, shard_size)]
+
+    if not key.isidentifier():
+        raise ValueError(f"invalid key column {key}")
+    cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM users;")
+    low, high = cursor.fetchone()
+    cursor.close()
+    if low is None:
+        return []
+    query = USERS_SELECT + f" WHERE {key} >= %s AND {key} < %s ORDER BY {key};"
+    return [(query, (start, start + shard_size))
+            for start in range(low, high + 1, shard_size)]
+
+
+def _export_shard(shard: Tuple[str, tuple]) -> List[str]:
+    """
+    Worker: read one shard over its own connection and return its rows
+    as formatted, redacted log lines
+    """
+    query, params = shard
+    formatter = RedactingFormatter(fields=PII_FIELDS)
+    redactor = RowRedactor(USERS_COLUMNS)
+    lines = []
+    db = get_db()
+    try:
+        cursor = db.cursor(buffered=False)
+        cursor.execute(query, params)
+        for row in cursor:
+            record = logging.LogRecord("user_data", logging.INFO, __file__,
+                                       0, redactor.format(row), None, None)
+            record.redacted = True
+            lines.append(formatter.format(record))
+        cursor.close()
+    finally:
+        db.close()
+    return lines
+
+
+_NO_MORE_ITEMS = object()
+
+
+def _map_bounded(pool: Pool, func, items: List, in_flight: int,
+                 ordered: bool) -> Iterator:
+    """
+    Yield func(item) for every item, computed by the pool with at most
+    in_flight items submitted and not yet consumed. ordered yields the
+    results in the order of items, else as soon as they are done.
+    """
+    if ordered:
+        pending = collections.deque()
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= in_flight:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        return
+
+    done = queue.Queue()
+    running = 0
+    for item in itertools.chain(items, [_NO_MORE_ITEMS]):
+        if item is not _NO_MORE_ITEMS:
+            pool.apply_async(func, (item,),
+                             callback=lambda result: done.put((True, result)),
+                             error_callback=lambda exc: done.put((False, exc)))
+            running += 1
+        # wait for a free slot, or for every result after the last item
+        while running >= in_flight or (item is _NO_MORE_ITEMS and running):
+            ok, result = done.get()
+            running -= 1
+            if not ok:
+                raise result
+            yield result
+
+
+def parallel_export_lines(workers: Optional[int] = None,
+                          shard_size: int = EXPORT_SHARD_SIZE,
+                          ordered: bool = True,
+                          key: Optional[str] = None,
+                          in_flight: Optional[int] = None) -> Iterator[str]:
+    """
+    Export the users table with a pool of worker processes, each one
+    redacting and formatting a shard of rows, and yield the formatted log
+    lines as one stream. ordered keeps the shards in the order of the
+    shard queries: by key, else sorted on every column, which is not the
+    order of the rows in the table (see _shard_queries); without it shards
+    are yielded as soon as they are done. At most in_flight shards (twice
+    the workers by default) are exported but not yet yielded, which
+    bounds the memory of the parent to in_flight * shard_size lines.
+    """
+    db = get_db()
+    try:
+        shards = _shard_queries(db, shard_size, key)
+    finally:
+        db.close()
+
+    with Pool(workers) as pool:
+        if in_flight is None:
+            in_flight = 2 * (workers or os.cpu_count() or 1)
+        for lines in _map_bounded(pool, _export_shard, shards,
+                                  max(in_flight, 1), ordered):
+            yield from lines
+
+
 def main() -> None:
     """
     Main function to retrieve data from the database
     """
+    batch_size = int(os.getenv('PERSONAL_DATA_EXPORT_BATCH_SIZE',
+                               EXPORT_BATCH_SIZE))
+    workers = int(os.getenv('PERSONAL_DATA_EXPORT_WORKERS', 1))
+    count = 0
+    start = time.perf_counter()
+
+    if workers > 1:
+        # sharded export by ranges of a numeric primary key, worker
+        # processes redact and format the lines; without a key, every
+        # LIMIT/OFFSET shard would sort the whole table
+        key = os.getenv('PERSONAL_DATA_EXPORT_KEY')
+        if not key:
+            sys.exit("PERSONAL_DATA_EXPORT_WORKERS > 1 needs "
+                     "PERSONAL_DATA_EXPORT_KEY, a numeric primary key column")
+        ordered = os.getenv('PERSONAL_DATA_EXPORT_ORDERED', '1') != '0'
+        for line in parallel_export_lines(workers, ordered=ordered, key=key):
+            sys.stderr.write(line + "\n")
+            count += 1
+        elapsed = time.perf_counter() - start
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"rows={count} workers={workers} rows/s={rate:.0f}",
+              file=sys.stderr)
+        return
+
     # database connection
     db = get_db()
-    cursor = db.cursor()
-
-    # retrieve all rows from the 'users' table
-    cursor.execute((
-        "SELECT name, email, phone, ssn, password, ip, last_login, user_agent "
-        "FROM users;"
-    ))
-    rows = cursor.fetchall()
 
     # the logger
     logger = get_logger()
 
-    # Log each row in the required format
-    for row in rows:
-        name, email, phone, ssn, password, ip, last_login, user_agent = row
-        message = (f"name={name}; email={email}; phone={phone}; ssn={ssn}; "
-                   f"password={password}; ip={ip}; last_login={last_login}; "
-                   f"user_agent={user_agent};")
-        # Log the messag
-        logger.info(message)
+    if os.getenv('PERSONAL_DATA_EXPORT_MASK_IN_SQL', '0') != '0':
+        # PII columns are masked by the server, skip the redaction pass
+        for line in stream_masked_lines(db, batch_size):
+            logger.info(line, extra={"redacted": True})
+            count += 1
+    else:
+        # Log each row in the required format, one batch at a time,
+        # redacted by column position so the formatter skips the regex
+        redactor = RowRedactor(USERS_COLUMNS)
+        for row in stream_rows(db, batch_size):
+            logger.info(redactor.format(row), extra={"redacted": True})
+            count += 1
+    elapsed = time.perf_counter() - start
 
-    cursor.close()
     db.close()
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"rows={count} batch_size={batch_size} rows/s={rate:.0f}",
+          file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -2,8 +2,12 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (Response, abort, jsonify, request,
+                   stream_with_context)
 from models.user import User
+from typing import Iterable, Iterator
+
+STREAM_CHUNK_SIZE = 100
 
 
 @app_views.route('/users/me', methods=['GET'], strict_slashes=False)
@@ -18,11 +22,58 @@ def get_me():
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters:
+      - limit (optional): maximum number of users
+      - cursor (optional): X-Next-Cursor header of the previous page
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, streamed in chunks:
+        in the order of User.all() without limit and cursor, else ordered
+        by creation
+      - X-Next-Cursor header if more users may follow
+      - 400 if limit or cursor is wrong
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return Response(stream_with_context(_stream_json_array(User.all())),
+                        mimetype='application/json')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "Wrong limit"}), 400
+    try:
+        users = User.iterate(limit=limit, cursor=cursor)
+    except ValueError:
+        return jsonify({'error': "Wrong cursor"}), 400
+
+    headers = {}
+    if limit is not None:
+        users = list(users)
+        if len(users) == limit:
+            headers['X-Next-Cursor'] = users[-1].cursor()
+    return Response(stream_with_context(_stream_json_array(users)),
+                    mimetype='application/json', headers=headers)
+
+
+def _stream_json_array(objs: Iterable) -> Iterator[bytes]:
+    """ Yield the JSON array of the to_json() of objs, in chunks of
+    STREAM_CHUNK_SIZE objects, from their cached encoded() form
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    yield b"["
+    chunk = []
+    separator = b""
+    for obj in objs:
+        chunk.append(obj.encoded())
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            yield separator + b",".join(chunk)
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + b",".join(chunk)
+    yield b"]\n"
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
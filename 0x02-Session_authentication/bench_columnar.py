@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+""" Benchmark of unindexed User.search() calls, scanning the objects in
+Python against evaluating them on the NumPy columnar mirror, with every
+result cross-checked, also after saves and removes
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from models.base import ENGINE
+from models.user import User
+
+SIZES = (100000, 1000000)
+REPEAT = 5
+SEARCHES = (
+    {'first_name': "First7"},
+    {'last_name': "Last42", 'first_name': "First3"},
+    {'first_name': None},
+    {'last_name': "nobody"},
+)
+
+
+def populate(count: int):
+    """ Replace the users by count users
+    """
+    rand = random.Random(0)
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(rand.randrange(100)),
+                    last_name="Last{}".format(rand.randrange(1000)))
+        ENGINE.data['User'][user.id] = user
+    ENGINE.rebuild_indexes(User)
+
+
+def timed(columnar: bool, attributes: dict) -> tuple:
+    """ Return the best duration in ms of REPEAT searches, and the ids
+    """
+    ENGINE.columnar = columnar
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        users = User.search(attributes)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, [user.id for user in users]
+
+
+def cross_check():
+    """ Compare every search with and without the mirror
+    """
+    for attributes in SEARCHES:
+        assert timed(True, attributes)[1] == timed(False, attributes)[1], \
+            "columnar search differs on {}".format(attributes)
+
+
+def main():
+    """ Print the duration of every search with both scans
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    os.chdir(tempfile.mkdtemp())
+    ENGINE.journal_mode = True
+    for count in sizes:
+        populate(count)
+        ENGINE.columnar = True
+        start = time.perf_counter()
+        User.search({'first_name': "First1", 'last_name': "Last1"})
+        print("{:>8} users  mirror built in {:.2f} s".format(
+            count, time.perf_counter() - start))
+        for attributes in SEARCHES:
+            t_scan, expected = timed(False, attributes)
+            t_columnar, found = timed(True, attributes)
+            assert found == expected, attributes
+            print("{:>8} users  {:<48} {:>6} found  scan {:8.2f} ms  "
+                  "columnar {:7.2f} ms  x{:.0f}".format(
+                      count, str(attributes), len(found), t_scan,
+                      t_columnar, t_scan / t_columnar))
+
+        users = User.all()
+        rand = random.Random(1)
+        for user in rand.sample(users, 100):
+            user.remove()
+        for user in rand.sample(User.all(), 100):
+            user.first_name = "First7"
+            user.save()
+        for i in range(100):
+            User(email="new{}@example.com".format(i), first_name="First7",
+                 last_name="Last42").save()
+        cross_check()
+        print("{:>8} users  cross-check after 300 changes OK".format(count))
+
+
+if __name__ == "__main__":
+    main()
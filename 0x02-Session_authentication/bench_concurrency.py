@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+""" Stress test of concurrent User reads and writes: 16 threads mix get,
+search, all, count, save and remove, then the file is reloaded and
+checked against memory. Also prints a throughput / thread count chart.
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import models.base
+from models.user import User
+
+THREADS = 16
+DURATION = 3.0
+USERS = 2000
+WRITE_RATIO = 0.1
+
+
+def worker(seed: int, deadline: float, counts: list, errors: list):
+    """ Run random operations until deadline
+    """
+    rand = random.Random(seed)
+    done = 0
+    try:
+        while time.perf_counter() < deadline:
+            op = rand.random()
+            if op < WRITE_RATIO / 2:
+                user = User(email="t{}-{}@example.com".format(seed, done))
+                user.save()
+            elif op < WRITE_RATIO:
+                users = User.all()
+                if users:
+                    user = rand.choice(users)
+                    if rand.random() < 0.5:
+                        user.remove()
+                    else:
+                        user.first_name = "Updated"
+                        user.save()
+            elif op < 0.4:
+                User.search({'email': "user{}@example.com".format(
+                    rand.randrange(USERS))})
+            elif op < 0.7:
+                users = User.all()
+                if users:
+                    User.get(rand.choice(users).id)
+            elif op < 0.9:
+                User.search({'first_name': "Updated"})
+            else:
+                User.count()
+            done += 1
+    except Exception as e:
+        errors.append(repr(e))
+    counts.append(done)
+
+
+def run(threads: int, duration: float) -> float:
+    """ Return the operations per second of threads workers
+    """
+    counts = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    pool = [threading.Thread(target=worker,
+                             args=(i, deadline, counts, errors))
+            for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    assert not errors, errors
+    return sum(counts) / duration
+
+
+def check_file():
+    """ Flush, reload the file and compare it with memory
+    """
+    models.base.ENGINE.flush()
+    expected = {user.id: user.to_json(True) for user in User.all()}
+    User.load_from_file()
+    loaded = {user.id: user.to_json(True) for user in User.all()}
+    assert loaded == expected, "file and memory differ"
+
+
+def main():
+    """ Stress test with THREADS threads, then chart the throughput
+    """
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else DURATION
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    for i in range(USERS):
+        user = User(email="user{}@example.com".format(i))
+        models.base.ENGINE.data['User'][user.id] = user
+    User.save_to_file()
+    User.load_from_file()
+
+    run(THREADS, duration)
+    check_file()
+    print("stress test: {} threads OK, {} users".format(
+        THREADS, User.count()))
+
+    results = [(threads, run(threads, duration))
+               for threads in (1, 2, 4, 8, 16)]
+    check_file()
+    best = max(rate for _, rate in results)
+    for threads, rate in results:
+        print("{:>2} threads {:9.0f} ops/s |{}".format(
+            threads, rate, "#" * int(50 * rate / best)))
+
+
+if __name__ == "__main__":
+    main()
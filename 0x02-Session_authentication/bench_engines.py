@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+""" Benchmark of the storage engines with several worker processes, like
+a multi-worker deployment: every worker creates users and reads them back,
+then a fresh process counts the users actually stored. The file engine
+loses the writes of the other workers, the SQLite one must not.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ENGINES = ("file", "sqlite")
+WORKERS = 4
+OPERATIONS = 500
+WRITE_RATIO = 0.2
+
+
+def worker(seed: int, operations: int, results):
+    """ Run operations mixing User saves, searches and gets
+    """
+    from models.user import User
+
+    User.load_from_file()
+    start = time.perf_counter()
+    saved = []
+    for i in range(operations):
+        if i % int(1 / WRITE_RATIO) == 0 or not saved:
+            user = User(email="w{}-{}@example.com".format(seed, i))
+            user.password = "pwd"
+            user.save()
+            saved.append(user.id)
+        elif i % 2:
+            User.search({'email': "w{}-{}@example.com".format(seed, i - 1)})
+        else:
+            User.get(saved[i % len(saved)])
+    results.put((len(saved), time.perf_counter() - start))
+
+
+def stored(results):
+    """ Count the users stored, as seen by a new process
+    """
+    from models.user import User
+
+    User.load_from_file()
+    results.put(User.count())
+
+
+def bench(engine: str, workers: int, operations: int) -> tuple:
+    """ Return the operations per second of the workers, the users they
+    saved and the users actually stored
+    """
+    os.environ['BASE_STORAGE'] = engine
+    os.chdir(tempfile.mkdtemp())
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=worker,
+                                 args=(seed, operations, results))
+                 for seed in range(workers)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    process = context.Process(target=stored, args=(results,))
+    process.start()
+    count = results.get()
+    process.join()
+    rate = sum(operations / elapsed for _, elapsed in outcomes)
+    return rate, sum(saves for saves, _ in outcomes), count
+
+
+def main():
+    """ Print the throughput and the lost writes of every engine
+    """
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for engine in ENGINES:
+        rate, saved, count = bench(engine, workers, OPERATIONS)
+        print("{:<7} {} workers {:9.0f} ops/s  {:>5} saved {:>5} stored "
+              "{:>5} lost".format(engine, workers, rate, saved, count,
+                                  saved - count))
+
+
+if __name__ == "__main__":
+    main()
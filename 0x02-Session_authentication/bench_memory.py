@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" tracemalloc report of the memory held by 100k and 1M users with the
+default __dict__ representation and with BASE_COMPACT=1 (__slots__)
+"""
+import os
+import subprocess
+import sys
+import tracemalloc
+
+SIZES = (100000, 1000000)
+
+
+def measure(count: int) -> int:
+    """ Return the bytes allocated to build count users in the file engine
+    """
+    from models.base import ENGINE
+    from models.user import User
+
+    User(id="warmup")
+    objs = ENGINE.data.setdefault("User", {})
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First", last_name="Last")
+        user.password = "pwd"
+        objs[user.id] = user
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current - start
+
+
+def main():
+    """ Measure every size in a child process per representation
+    """
+    if len(sys.argv) == 3 and sys.argv[1] == "--measure":
+        print(measure(int(sys.argv[2])))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    for size in sizes:
+        results = {}
+        for compact in ("0", "1"):
+            env = dict(os.environ, BASE_COMPACT=compact)
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--measure", str(size)], env=env)
+            results[compact] = int(output)
+        print("{:>8} users  __dict__ {:8.1f} MB ({:4.0f} B/user)  "
+              "__slots__ {:8.1f} MB ({:4.0f} B/user)  -{:.0f}%".format(
+                  size, results["0"] / 2 ** 20, results["0"] / size,
+                  results["1"] / 2 ** 20, results["1"] / size,
+                  100 - 100 * results["1"] / results["0"]))
+
+
+if __name__ == "__main__":
+    main()
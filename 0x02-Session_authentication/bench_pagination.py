@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" Benchmark of the peak memory allocated by GET /api/v1/users: the whole
+list built by jsonify against the streamed response, in full and by pages
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SIZES = (100000, 1000000)
+LIMIT = 100
+
+
+def populate(count: int):
+    """ Replace the users by count users
+    """
+    from models.base import ENGINE
+    from models.user import User
+
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        ENGINE.data['User'][user.id] = user
+        ENGINE.update_indexes(user)
+
+
+def measure(request) -> tuple:
+    """ Return the peak memory in MiB and the duration of request()
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = request()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20, elapsed, size
+
+
+def main():
+    """ Print peak memory and duration of every way to list the users
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp())
+    import api.v1.app
+    from flask import jsonify
+    from models.user import User
+
+    # measure the listing, not the authentication
+    api.v1.app.auth = None
+    app = api.v1.app.app
+    client = app.test_client()
+
+    def whole_list() -> int:
+        """ Previous view: every to_json() then one jsonify """
+        with app.app_context():
+            return len(jsonify([user.to_json()
+                                for user in User.all()]).get_data())
+
+    def streamed() -> int:
+        """ Streamed array of all the users, read chunk by chunk """
+        response = client.get("/api/v1/users", buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        return size
+
+    def page() -> int:
+        """ One page of LIMIT users after a cursor """
+        return len(client.get("/api/v1/users?limit={}".format(
+            LIMIT)).get_data())
+
+    for count in sizes:
+        populate(count)
+        for name, request in (("jsonify list", whole_list),
+                              ("streamed", streamed),
+                              ("limit={}".format(LIMIT), page)):
+            peak, elapsed, size = measure(request)
+            print("{:>8} users  {:<12} peak {:8.1f} MiB  {:7.3f} s  "
+                  "{:>10} bytes".format(count, name, peak, elapsed, size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+""" Benchmark of PUT /api/v1/users/<id> through the Flask test client,
+serializing every user on each save against reusing the cached record of
+the unmodified ones (dirty tracking, BASE_DIRTY_TRACKING=1)
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+SIZES = (10000, 50000)
+REQUESTS = 50
+
+
+def populate(count: int):
+    """ Replace the users by count users
+    """
+    from models.base import ENGINE
+    from models.user import User
+
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        user.password = "pwd"
+        ENGINE.data['User'][user.id] = user
+    User.save_to_file()
+    User.load_from_file()
+
+
+def bench_puts(client, requests: int) -> float:
+    """ Return the PUT /api/v1/users/<id> per second
+    """
+    from models.user import User
+
+    ids = [user.id for user in User.all()]
+    rand = random.Random(0)
+    start = time.perf_counter()
+    for i in range(requests):
+        response = client.put("/api/v1/users/{}".format(rand.choice(ids)),
+                              json={"first_name": "Put{}".format(i)})
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    """ Print PUT/s with and without the cached records for every size
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp())
+    import api.v1.app
+    import models.base
+    from models.user import User
+
+    # measure the storage, not the authentication
+    api.v1.app.auth = None
+    client = api.v1.app.app.test_client()
+    for size in sizes:
+        rates = []
+        for cached in (False, True):
+            models.base.ENGINE.dirty_tracking = cached
+            populate(size)
+            rates.append(bench_puts(client, REQUESTS))
+            expected = {user.id: user.to_json(True) for user in User.all()}
+            User.load_from_file()
+            assert expected == {user.id: user.to_json(True)
+                                for user in User.all()}, "file differs"
+        print("{:>6} users  full {:7.1f} PUT/s  dirty tracking {:7.1f} "
+              "PUT/s  x{:.2f}".format(size, rates[0], rates[1],
+                                      rates[1] / rates[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Benchmark of User.query() and its planner against a linear scan of all
+users, for range, multi-equality and prefix queries at 100k and 1M users
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from models.base import ENGINE
+from models.query import Between, Equal, Prefix
+from models.user import User
+
+SIZES = (100000, 1000000)
+REPEAT = 5
+START = datetime(2024, 1, 1)
+
+
+def populate(count: int):
+    """ Replace the users by count users created over count minutes
+    """
+    rand = random.Random(0)
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        created_at = START + timedelta(minutes=i)
+        user = User(email="user{}@example.com".format(i),
+                    created_at=created_at.isoformat(),
+                    first_name="First{}".format(rand.randrange(100)),
+                    last_name="Last{}".format(rand.randrange(1000)))
+        ENGINE.data['User'][user.id] = user
+    ENGINE.rebuild_indexes(User)
+
+
+def linear_scan(*predicates) -> list:
+    """ Filter and sort all users, without any index
+    """
+    return sorted([user for user in User.all()
+                   if all(predicate.matches(getattr(user, predicate.attribute,
+                                                    None))
+                          for predicate in predicates)],
+                  key=User.sort_key)
+
+
+def timed(function, *args) -> tuple:
+    """ Return the best duration in ms of REPEAT calls, and the result
+    """
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, result
+
+
+def main():
+    """ Print the duration of every query with the planner and the scan
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    os.chdir(tempfile.mkdtemp())
+    for count in sizes:
+        populate(count)
+        for attr in User.sorted_attributes:
+            start = time.perf_counter()
+            ENGINE.sorted_index(User, attr)
+            print("{:>8} users  sorted index {} built in {:.2f} s".format(
+                count, attr, time.perf_counter() - start))
+        after = START + timedelta(minutes=count - count // 100)
+        queries = (
+            ("created_at after T (1%)", (Between('created_at', after),)),
+            ("last_name = X and first_name = Y",
+             (Equal('last_name', "Last7"), Equal('first_name', "First3"))),
+            ("email prefix", (Prefix('email', "user4242"),)),
+            ("email = X", (Equal('email', "user4242@example.com"),)),
+        )
+        for name, predicates in queries:
+            t_query, found = timed(User.query, *predicates)
+            t_scan, expected = timed(linear_scan, *predicates)
+            assert found == expected, name
+            print("{:>8} users  {:<33} {:>6} found  scan {:9.2f} ms  "
+                  "query {:8.3f} ms  x{:<8.0f} {}".format(
+                      count, name, len(found), t_scan, t_query,
+                      t_scan / t_query,
+                      ENGINE.plan(User, list(predicates))[0]))
+
+
+if __name__ == "__main__":
+    main()
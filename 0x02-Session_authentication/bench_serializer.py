@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+""" Benchmark of User.load_from_file() and User.save_to_file() with every
+serializer, and of the timestamp codec against strptime/strftime
+"""
+import os
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+
+from models.base import ENGINE
+from models.serializer import (SERIALIZERS, TIMESTAMP_FORMAT,
+                               format_timestamp, parse_timestamp)
+from models.user import User
+
+SIZE = 100000
+
+
+def bench_timestamps():
+    """ Print the cost of parsing and formatting one timestamp
+    """
+    value = "2024-09-20T10:00:00"
+    date = datetime(2024, 9, 20, 10, 0, 0)
+    number = 200000
+    for label, stmt in (
+            ("strptime", lambda: datetime.strptime(value, TIMESTAMP_FORMAT)),
+            ("parse_timestamp", lambda: parse_timestamp(value)),
+            ("strftime", lambda: date.strftime(TIMESTAMP_FORMAT)),
+            ("format_timestamp", lambda: format_timestamp(date))):
+        print("{:<17} {:6.3f} us".format(
+            label, timeit.timeit(stmt, number=number) / number * 1e6))
+
+
+def main():
+    """ Print save/load time and file size of every serializer
+    """
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    bench_timestamps()
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    for i in range(size):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        user.password = "pwd"
+        ENGINE.data["User"][user.id] = user
+    expected = [user.to_json(True) for user in User.all()]
+
+    for name in SERIALIZERS:
+        ENGINE.serializer_name = name
+        try:
+            start = time.perf_counter()
+            User.save_to_file()
+            saved = time.perf_counter()
+        except ImportError as e:
+            print("{:<8} skipped: {}".format(name, e))
+            continue
+        ENGINE.lazy_load = True
+        User.load_from_file()
+        loaded = time.perf_counter()
+        ENGINE.materialize(User)
+        built = time.perf_counter()
+        ENGINE.lazy_load = False
+        assert [user.to_json(True) for user in User.all()] == expected
+        print("{:<8} {:>7} users  save {:6.3f} s  load {:6.3f} s  "
+              "build {:6.3f} s  {:6.1f} MB".format(
+                  name, size, saved - start, loaded - saved, built - loaded,
+                  ENGINE.snapshot_stats(User)["size"] / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+""" Benchmark of User.save() and User.load_from_file() with the single
+main file against the hash-sharded layout, on 100k users
+"""
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+
+from models.base import ENGINE
+from models.user import User
+
+SIZE = 100000
+SAVES = 50
+LAYOUTS = (0, 16, 64)
+
+
+def populate(count: int):
+    """ Replace the users by count users, written in the current layout
+    """
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        ENGINE.data['User'][user.id] = user
+    User.save_to_file()
+    User.load_from_file()
+
+
+def bench(shards: int, count: int) -> tuple:
+    """ Return the saves per second, the files rewritten per save and the
+    load duration of a layout
+    """
+    ENGINE.shards = shards
+    populate(count)
+    # users are loaded shard after shard: pick them anywhere
+    users = random.Random(0).sample(User.all(), SAVES)
+    mtimes = {f: os.stat(f).st_mtime_ns for f in glob.glob(".db_User.*")}
+    start = time.perf_counter()
+    for user in users:
+        user.first_name = "Saved"
+        user.save()
+    rate = SAVES / (time.perf_counter() - start)
+    rewritten = len([f for f, mtime in mtimes.items()
+                     if os.stat(f).st_mtime_ns != mtime])
+
+    start = time.perf_counter()
+    User.load_from_file()
+    loaded = time.perf_counter() - start
+    assert User.count() == count, "lost users"
+    assert len(User.search({'first_name': "Saved"})) == SAVES, "lost saves"
+    return rate, rewritten, loaded
+
+
+def main():
+    """ Print saves/s and load time of every layout
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    os.chdir(tempfile.mkdtemp())
+    for shards in LAYOUTS:
+        rate, rewritten, loaded = bench(shards, count)
+        print("{:>7} users  {:>2} shards  {:8.1f} saves/s  {:>2} files "
+              "rewritten by {} saves  load {:.2f} s".format(
+                  count, shards, rate, rewritten, SAVES, loaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Benchmark of the startup cost of User.load_from_file(), eager against
+lazy, for 100k and 1M records
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import models.base
+from models.user import User
+
+SIZES = (100000, 1000000)
+
+
+def write_records(count: int):
+    """ Write a .db_User.json holding count users
+    """
+    objs_json = {}
+    for i in range(count):
+        obj_id = str(uuid.uuid4())
+        objs_json[obj_id] = {
+            "id": obj_id,
+            "created_at": "2024-09-20T10:00:00",
+            "updated_at": "2024-09-20T10:00:00",
+            "email": "user{}@example.com".format(i),
+            "_password": "9f86d081884c7d659a2feaa0c55ad015"
+                         "a3bf4f1b2b0b822cd15d6c15b0f00a08",
+            "first_name": "First{}".format(i),
+            "last_name": "Last{}".format(i),
+        }
+    with open(".db_User.json", "w") as f:
+        json.dump(objs_json, f)
+    return obj_id
+
+
+def main():
+    """ Print load time, count() and first get() for both modes
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    os.chdir(tempfile.mkdtemp())
+    for size in sizes:
+        last_id = write_records(size)
+        for lazy in (False, True):
+            models.base.ENGINE.lazy_load = lazy
+            start = time.perf_counter()
+            User.load_from_file()
+            loaded = time.perf_counter()
+            assert User.count() == size, "wrong count"
+            counted = time.perf_counter()
+            assert User.get(last_id) is not None, "lost a user"
+            done = time.perf_counter()
+            print("{:>8} records  {:<5}  load {:7.3f} s  count {:.6f} s"
+                  "  first get {:.6f} s".format(
+                      size, "lazy" if lazy else "eager", loaded - start,
+                      counted - loaded, done - counted))
+            models.base.ENGINE.data["User"] = {}
+            models.base.ENGINE.raw["User"] = {}
+
+
+if __name__ == "__main__":
+    main()
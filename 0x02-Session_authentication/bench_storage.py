@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+""" Benchmark of User.save() with a full file rewrite per save against the
+append-only journal and the write-behind modes, on top of 10k and 100k
+existing users
+"""
+import os
+import sys
+import tempfile
+import time
+
+from models.base import ENGINE
+from models.user import User
+
+SIZES = (10000, 100000)
+SAVES = 200
+MODES = (
+    ("rewrite", False, ''),
+    ("journal", True, ''),
+    ("write-behind", False, 'none'),
+    ("journal+write-behind", True, 'none'),
+)
+
+
+def populate(count: int):
+    """ Fill the file engine with count users and write them to the main file
+    """
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        ENGINE.data['User'][user.id] = user
+    User.save_to_file()
+
+
+def bench_saves(journal: bool, durability: str, saves: int) -> float:
+    """ Return the number of User.save() per second
+    """
+    ENGINE.journal_mode = journal
+    ENGINE.durability = durability
+    start = time.perf_counter()
+    for i in range(saves):
+        user = User(email="new{}@example.com".format(i))
+        user.password = "pwd"
+        user.save()
+    elapsed = time.perf_counter() - start
+    ENGINE.flush()
+    return saves / elapsed
+
+
+def main():
+    """ Print saves/s of every mode for every size
+    """
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+    os.chdir(tempfile.mkdtemp())
+    for size in sizes:
+        for name, journal, durability in MODES:
+            populate(size)
+            rate = bench_saves(journal, durability, SAVES)
+            User.load_from_file()
+            assert User.count() == size + SAVES, "lost a save"
+            print("{:>7} users  {:<22} {:10.1f} saves/s".format(
+                size, name, rate))
+
+
+if __name__ == "__main__":
+    main()
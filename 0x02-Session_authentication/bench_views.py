@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+""" Benchmark of GET /api/v1/users at 50k users: every to_json() formatted
+again against the cached encoded views (BASE_VIEW_CACHE=1), with the body
+checked against the uncached one and the memory the cache holds
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SIZE = 50000
+REPEAT = 5
+CHANGED = 100
+
+
+def populate(count: int):
+    """ Replace the users by count users
+    """
+    from models.base import ENGINE
+    from models.user import User
+
+    User.load_from_file()
+    ENGINE.data['User'].clear()
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First{}".format(i), last_name="Last")
+        ENGINE.data['User'][user.id] = user
+        ENGINE.update_indexes(user)
+
+
+def main():
+    """ Print the duration of the listing without and with the cache
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp())
+    import api.v1.app
+    from flask import json
+    from models.base import ENGINE
+    from models.user import User
+
+    # measure the listing, not the authentication
+    api.v1.app.auth = None
+    app = api.v1.app.app
+    client = app.test_client()
+
+    def listing(cold: bool) -> tuple:
+        """ Return the best duration in ms of REPEAT requests, and the
+        body """
+        best = None
+        ENGINE.view_cache = not cold
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            body = client.get("/api/v1/users").get_data()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, body
+
+    def expected() -> bytes:
+        """ Body built from to_json() without any cache """
+        with app.app_context():
+            return json.dumps([user.build_json(False)
+                               for user in User.all()],
+                              separators=(",", ":")).encode() + b"\n"
+
+    populate(count)
+    t_cold, body = listing(True)
+    assert body == expected(), "cold body differs"
+    t_warm, body = listing(False)
+    assert body == expected(), "warm body differs"
+    ENGINE.views.clear()
+    tracemalloc.start()
+    client.get("/api/v1/users").get_data()
+    cached = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("{:>7} users  uncached {:8.1f} ms  cached {:8.1f} ms  "
+          "x{:.1f}  cache {:.0f} B/user".format(
+              count, t_cold, t_warm, t_cold / t_warm, cached / count))
+
+    for user in User.all()[:CHANGED]:
+        user.last_name = "Changed"
+    t_changed, body = listing(False)
+    assert body == expected(), "body differs after changes"
+    print("{:>7} users  {} changed, cached {:8.1f} ms".format(
+        count, CHANGED, t_changed))
+
+
+if __name__ == "__main__":
+    main()
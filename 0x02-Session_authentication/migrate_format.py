@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+""" Convert the stored objects of model classes to another file format,
+with the server stopped:
+
+    ./migrate_format.py <serializer> [Class ...]
+
+serializer is one of models.serializer.SERIALIZERS (json, marshal,
+msgpack), and the classes default to User. The single .db_<Class> file or
+the shard files keep their layout, the journal is folded in. Restart the
+server with BASE_SERIALIZER set to the same format.
+"""
+import sys
+
+from models.file_engine import FileEngine
+from models.serializer import SERIALIZERS
+from models.user import User
+
+MODELS = {
+    'User': User,
+}
+
+
+def main():
+    """ Convert every class given on the command line
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in SERIALIZERS:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    serializer = sys.argv[1]
+    engine = FileEngine()
+    for name in sys.argv[2:] or ['User']:
+        if name not in MODELS:
+            print("unknown class {}".format(name), file=sys.stderr)
+            sys.exit(1)
+        shards = engine.migrate_file(MODELS[name], serializer)
+        print("{}: {} ({})".format(name, serializer, "{} shard(s)".format(
+            shards) if shards else "single file"))
+
+
+if __name__ == "__main__":
+    main()
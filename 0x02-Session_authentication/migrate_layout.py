@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+""" Move the stored objects of model classes between the single file and
+the hash-sharded layouts, with the server stopped:
+
+    ./migrate_layout.py <shards> [Class ...]
+
+shards is the number of shard files, 0 for the single .db_<Class> file,
+and the classes default to User. Restart the server with BASE_SHARDS set
+to the same number.
+"""
+import sys
+
+from models.file_engine import FileEngine
+from models.user import User
+
+MODELS = {
+    'User': User,
+}
+
+
+def main():
+    """ Reshard every class given on the command line
+    """
+    if len(sys.argv) < 2 or not sys.argv[1].isdigit():
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    shards = int(sys.argv[1])
+    engine = FileEngine()
+    for name in sys.argv[2:] or ['User']:
+        if name not in MODELS:
+            print("unknown class {}".format(name), file=sys.stderr)
+            sys.exit(1)
+        engine.reshard(MODELS[name], shards)
+        print("{}: {} shard(s)".format(name, shards) if shards
+              else "{}: single file".format(name))
+
+
+if __name__ == "__main__":
+    main()
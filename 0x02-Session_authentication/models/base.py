@@ -2,36 +2,80 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from typing import TypeVar, List, Iterable, Iterator
+from os import getenv
+import base64
 import json
 import uuid
+from models.engine import get_engine
+from models.query import Predicate
+from models.serializer import (TIMESTAMP_FORMAT, at_stored_precision,
+                               format_timestamp, parse_timestamp)
+
+
+# Storage engine: 'file' holds the objects in memory and persists them to
+# the .db_<Class> files, which only one process may write, see
+# models.file_engine (configured by the BASE_* variables it documents);
+# 'sqlite' keeps every object in the SQLite database BASE_SQLITE_PATH (WAL
+# mode), shared by all the worker processes of a deployment, see
+# models.engine. On the first load_from_file(), an empty database imports
+# the .db_<Class> files.
+STORAGE = getenv('BASE_STORAGE', 'file')
+SQLITE_PATH = getenv('BASE_SQLITE_PATH', '.db.sqlite3')
+ENGINE = get_engine(STORAGE, SQLITE_PATH)
+
+# The objects held in memory, DATA[class][id]: those of the file engine
+# (ENGINE.data), empty with the 'sqlite' one
+DATA = getattr(ENGINE, 'data', {})
+
+# Compact representation: models declare their attributes in __slots__
+# instead of carrying a per-instance __dict__ (decided at import time)
+COMPACT_MODELS = getenv('BASE_COMPACT', '0') != '0'
+SLOT_NAMES = {}
+
+
+def _encode(record: dict) -> bytes:
+    """ Return record as compact JSON bytes, with sorted keys like the
+    responses of the API
+    """
+    return json.dumps(record, sort_keys=True,
+                      separators=(",", ":")).encode()
 
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+def _attributes(obj) -> Iterable:
+    """ Return the (name, value) pairs of the attributes of obj, in the
+    order they were declared and whatever the representation
+    """
+    if not COMPACT_MODELS:
+        return list(obj.__dict__.items())
+    cls = obj.__class__
+    names = SLOT_NAMES.get(cls)
+    if names is None:
+        names = [name for klass in reversed(cls.__mro__)
+                 for name in getattr(klass, '__slots__', ())]
+        SLOT_NAMES[cls] = names
+    return [(name, getattr(obj, name)) for name in names
+            if hasattr(obj, name)]
 
 
 class Base():
     """ Base class
     """
+    __slots__ = ('id', 'created_at', 'updated_at') if COMPACT_MODELS \
+        else ('__dict__', '__weakref__')
+    indexed_attributes = ()
+    sorted_attributes = ('created_at', 'updated_at')
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = parse_timestamp(kwargs.get('created_at'))
         else:
             self.created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.updated_at = parse_timestamp(kwargs.get('updated_at'))
         else:
             self.updated_at = datetime.utcnow()
 
@@ -44,15 +88,42 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute and mark the object as modified
+        """
+        object.__setattr__(self, name, value)
+        ENGINE.touch(self)
+
+    def encoded(self) -> bytes:
+        """ Return to_json() as compact JSON bytes with sorted keys,
+        cached until the object is modified
+        """
+        view = ENGINE.view(self)
+        if view is None:
+            return _encode(self.build_json(False))
+        if view[1] is None:
+            view[1] = _encode(view[0])
+        return view[1]
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        if for_serialization:
+            return dict(ENGINE.serialized(self))
+        view = ENGINE.view(self)
+        if view is None:
+            return self.build_json(False)
+        return dict(view[0])
+
+    def build_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of to_json(), without any cache
+        """
         result = {}
-        for key, value in self.__dict__.items():
+        for key, value in _attributes(self):
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = format_timestamp(value)
             else:
                 result[key] = value
         return result
@@ -61,52 +132,30 @@ class Base():
     def load_from_file(cls):
         """ Load all objects from file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        ENGINE.load(cls)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
-
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+        ENGINE.snapshot(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        ENGINE.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        ENGINE.remove(self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return ENGINE.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,20 +167,58 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return ENGINE.get(cls, id)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+        return ENGINE.search(cls, attributes)
+
+    @classmethod
+    def query(cls, *predicates: Predicate) -> List[TypeVar('Base')]:
+        """ Return the objects matching every predicate (see models.query:
+        Equal, Between, Prefix), ordered by created_at then id
+        """
+        return ENGINE.query(cls, list(predicates))
+
+    def sort_key(self) -> tuple:
+        """ Return the (created_at, id) order of the pages of iterate(),
+        created_at at its stored precision so that the order does not
+        change when the objects are loaded again
+        """
+        return (at_stored_precision(self.created_at), self.id)
+
+    def cursor(self) -> str:
+        """ Return the cursor token of iterate() resuming after the object
+        """
+        created_at = at_stored_precision(self.created_at)
+        token = "{}|{}".format(created_at.isoformat(), self.id)
+        return base64.urlsafe_b64encode(token.encode()).decode()
+
+    @staticmethod
+    def parse_cursor(cursor: str) -> tuple:
+        """ Return the sort_key() of a cursor token, or raise ValueError
+        """
+        try:
+            token = base64.urlsafe_b64decode(cursor.encode()).decode()
+            created_at, obj_id = token.split('|', 1)
+            created_at = datetime.fromisoformat(created_at)
+        except (TypeError, ValueError, AttributeError):
+            raise ValueError("invalid cursor {}".format(cursor))
+        if created_at.tzinfo is not None:
+            raise ValueError("invalid cursor {}".format(cursor))
+        return (at_stored_precision(created_at), obj_id)
+
+    @classmethod
+    def iterate(cls, attributes: dict = {}, limit: int = None,
+                offset: int = 0, cursor: str = None) \
+            -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes ordered by
+        created_at then id: the objects after the cursor token, if any,
+        skipping offset of them and yielding at most limit
+        A page only holds its offset + limit objects, and the iteration
+        stays stable when objects are added or removed between pages.
+        """
+        after = cls.parse_cursor(cursor) if cursor is not None else None
+        return ENGINE.iterate(cls, attributes, after, limit, offset)
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+""" Columnar module: NumPy mirror of the objects of a class, to evaluate
+the predicates of a full scan on whole columns (needs numpy)
+"""
+from datetime import datetime, timedelta
+from typing import List
+import collections
+import threading
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from models.query import Between, Equal, Predicate
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+# codes of the rows whose value is not in the dictionary
+_MISSING = -1
+_UNHASHABLE = -2
+# epoch values of None and of a missing attribute in a timestamp column
+_NAT = -2 ** 63
+_NO_TIME = _NAT + 1
+# value of a missing attribute
+_ABSENT = object()
+
+
+class _Mismatch(Exception):
+    """ Value that the column cannot hold
+    """
+
+
+class Column():
+    """ Column class: one attribute of every row, as epoch microseconds
+    when its values are all naive datetimes (or None), else as codes of a
+    dictionary of the distinct values
+    """
+
+    def __init__(self, values: list, capacity: int):
+        """ Initialize the column of values, one per row (_ABSENT when
+        an attribute is missing)
+        """
+        # rows holding no value, the removed ones excepted
+        self.missing = len(values)
+        self.timestamps = all(value is None or value is _ABSENT or (
+            type(value) is datetime and value.tzinfo is None)
+            for value in values)
+        if self.timestamps:
+            self.data = numpy.full(capacity, _NO_TIME, numpy.int64)
+        else:
+            self.data = numpy.full(capacity, _MISSING, numpy.int32)
+            self.dictionary = {}
+        for row, value in enumerate(values):
+            self.set(row, value)
+
+    def grow(self, capacity: int):
+        """ Extend the column to capacity rows
+        """
+        data = numpy.full(capacity, self.empty(), self.data.dtype)
+        data[:len(self.data)] = self.data
+        self.data = data
+
+    def empty(self) -> int:
+        """ Return the number stored for a missing attribute
+        """
+        return _NO_TIME if self.timestamps else _MISSING
+
+    def append(self, row: int):
+        """ Start a new row, holding no value
+        """
+        self.missing += 1
+
+    def remove(self, row: int):
+        """ Forget a removed row
+        """
+        if self.data[row] == self.empty():
+            self.missing -= 1
+        self.data[row] = self.empty()
+
+    def encode(self, value) -> int:
+        """ Return the number stored for value, or raise _Mismatch
+        """
+        if self.timestamps:
+            if value is _ABSENT:
+                return _NO_TIME
+            if value is None:
+                return _NAT
+            if type(value) is not datetime or value.tzinfo is not None:
+                raise _Mismatch()
+            return (value - _EPOCH) // _MICROSECOND
+        if value is _ABSENT:
+            return _MISSING
+        try:
+            return self.dictionary.setdefault(value, len(self.dictionary))
+        except TypeError:
+            return _UNHASHABLE
+
+    def set(self, row: int, value):
+        """ Store the value of a row, _ABSENT for a missing attribute
+        """
+        number = self.encode(value)
+        if self.data[row] == self.empty():
+            self.missing -= 1
+        if value is _ABSENT:
+            self.missing += 1
+        self.data[row] = number
+
+    def mask(self, predicate: Predicate, size: int):
+        """ Return the boolean mask of the first size rows matching the
+        predicate, or None if it cannot be evaluated on the column
+        """
+        data = self.data[:size]
+        if self.timestamps:
+            if isinstance(predicate, Equal):
+                try:
+                    return data == self.encode(predicate.value)
+                except _Mismatch:
+                    # a datetime is not equal to anything else
+                    return numpy.zeros(size, bool)
+            if isinstance(predicate, Between):
+                try:
+                    low, high = [None if bound is None
+                                 else self.encode(bound)
+                                 for bound in predicate.bounds()]
+                except _Mismatch:
+                    return numpy.zeros(size, bool)
+                if _NAT in (low, high):
+                    return numpy.zeros(size, bool)
+                mask = data > _NO_TIME
+                if low is not None:
+                    mask &= data >= low
+                if high is not None:
+                    mask &= data <= high
+                return mask
+            return None
+
+        if isinstance(predicate, Equal):
+            try:
+                code = self.dictionary.get(predicate.value)
+            except TypeError:
+                return None
+            if code is None:
+                return numpy.zeros(size, bool)
+            return data == code
+        codes = [code for value, code in self.dictionary.items()
+                 if predicate.matches(value)]
+        return numpy.isin(data, numpy.array(codes, numpy.int32))
+
+
+class ColumnStore():
+    """ ColumnStore class: columnar mirror of the objects of a class
+    Rows follow the order of the objects in their dictionary (see add());
+    the ids of the objects assigned since the last refresh() are in stale,
+    and the columns are only built for the attributes queried.
+    """
+
+    def __init__(self, objs: dict):
+        """ Initialize the mirror of objs, {id: object}
+        """
+        if numpy is None:
+            raise ImportError("the columnar mirror needs numpy")
+        self.lock = threading.Lock()
+        self.stale = set()
+        self.added = collections.deque()
+        self.build(objs)
+
+    def build(self, objs: dict):
+        """ Mirror again every object of objs
+        """
+        self.ids = list(objs.keys())
+        self.rows = {obj_id: row for row, obj_id in enumerate(self.ids)}
+        self.capacity = max(1024, 2 * len(self.ids))
+        self.alive = numpy.zeros(self.capacity, bool)
+        self.alive[:len(self.ids)] = True
+        self.removed = 0
+        self.columns = {}
+
+    def touch(self, obj_id: str):
+        """ Mark the object of obj_id as changed
+        """
+        self.stale.add(obj_id)
+
+    def add(self, obj_id: str):
+        """ Mark the object of obj_id as (re)inserted at the end of the
+        objects, which its row must follow
+        """
+        self.added.append(obj_id)
+
+    def refresh(self, objs: dict):
+        """ Apply to the rows the changes of the added and stale objects
+        """
+        while self.added:
+            obj_id = self.added.popleft()
+            obj = objs.get(obj_id)
+            if obj_id in self.rows:
+                self._remove(obj_id)
+            if obj is not None:
+                self._append(obj_id, obj)
+        while self.stale:
+            obj_id = self.stale.pop()
+            obj = objs.get(obj_id)
+            if obj is None:
+                if obj_id in self.rows:
+                    self._remove(obj_id)
+            elif obj_id not in self.rows:
+                self._append(obj_id, obj)
+            else:
+                self._set(self.rows[obj_id], obj)
+        if self.removed > 1024 and self.removed * 2 > len(self.ids):
+            self.build(objs)
+
+    def _append(self, obj_id: str, obj):
+        """ Add a row for an object
+        """
+        row = len(self.ids)
+        if row == self.capacity:
+            self.capacity *= 2
+            alive = numpy.zeros(self.capacity, bool)
+            alive[:row] = self.alive[:row]
+            self.alive = alive
+            for column in self.columns.values():
+                column.grow(self.capacity)
+        self.ids.append(obj_id)
+        self.rows[obj_id] = row
+        self.alive[row] = True
+        for column in self.columns.values():
+            column.append(row)
+        self._set(row, obj)
+
+    def _set(self, row: int, obj):
+        """ Store the values of an object in its row
+        """
+        for attr, column in list(self.columns.items()):
+            try:
+                column.set(row, getattr(obj, attr, _ABSENT))
+            except _Mismatch:
+                # built again on the next select()
+                del self.columns[attr]
+
+    def _remove(self, obj_id: str):
+        """ Drop the row of an object
+        """
+        row = self.rows.pop(obj_id)
+        for column in self.columns.values():
+            column.remove(row)
+        self.alive[row] = False
+        self.ids[row] = None
+        self.removed += 1
+
+    def column(self, attr: str, objs: dict) -> Column:
+        """ Return the column of attr, built if needed
+        """
+        column = self.columns.get(attr)
+        if column is None:
+            # a row removed from objs but not refreshed yet counts as
+            # missing until it is
+            values = [getattr(objs.get(obj_id, _ABSENT), attr, _ABSENT)
+                      for obj_id in self.ids]
+            column = Column(values, self.capacity)
+            column.missing -= self.removed
+            self.columns[attr] = column
+        return column
+
+    def select(self, predicates: List[Predicate], objs: dict) -> list:
+        """ Return the ids of the objects of objs matching every predicate,
+        in row order, or None if a predicate cannot be evaluated here
+        """
+        with self.lock:
+            self.refresh(objs)
+            size = len(self.ids)
+            mask = self.alive[:size].copy()
+            for predicate in predicates:
+                column = self.column(predicate.attribute, objs)
+                if column.missing > 0:
+                    # objects without the attribute: left to the scan
+                    return None
+                predicate_mask = column.mask(predicate, size)
+                if predicate_mask is None:
+                    return None
+                mask &= predicate_mask
+            ids = self.ids
+            return [ids[row] for row in numpy.flatnonzero(mask)]
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+""" Engine module: storage engines behind models.base.Base
+
+Every get/search/count/all/save/remove of Base goes to its engine: the
+default 'file' one (models.file_engine) holds the objects in memory and
+persists them to the .db_<Class> files, the 'sqlite' one below keeps them
+in a database shared by several processes.
+"""
+from datetime import datetime
+from typing import Iterator, List, TypeVar
+import json
+import os
+import sqlite3
+import threading
+
+from models.query import Equal, Predicate, Prefix
+from models.serializer import format_timestamp
+
+
+class StorageEngine():
+    """ StorageEngine class: interface of a storage engine
+    """
+
+    def load(self, cls):
+        """ Prepare the storage of cls, reading its stored objects
+        """
+        raise NotImplementedError()
+
+    def snapshot(self, cls):
+        """ Persist every object of cls at once
+        """
+        raise NotImplementedError()
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        raise NotImplementedError()
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return all objects with matching attributes
+        """
+        raise NotImplementedError()
+
+    def iterate(self, cls, attributes: dict, after: tuple, limit: int,
+                offset: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes ordered by
+        (created_at, id), from the first one after the key after (if not
+        None), skipping offset of them and yielding at most limit
+        """
+        raise NotImplementedError()
+
+    def query(self, cls, predicates: List[Predicate]) \
+            -> List[TypeVar('Base')]:
+        """ Return the objects matching every predicate of models.query,
+        ordered by (created_at, id)
+        """
+        raise NotImplementedError()
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        raise NotImplementedError()
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        raise NotImplementedError()
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        raise NotImplementedError()
+
+    def touch(self, obj: TypeVar('Base')):
+        """ Drop what is cached for obj, one of its attributes was
+        assigned; nothing is cached by default
+        """
+
+    def serialized(self, obj: TypeVar('Base')) -> dict:
+        """ Return the to_json(True) record of obj, which may be cached and
+        shared: not to be modified
+        """
+        return obj.build_json(True)
+
+    def view(self, obj: TypeVar('Base')) -> list:
+        """ Return the [to_json() record, encoded bytes or None] cached
+        for obj, or None when the engine caches none
+        """
+        return None
+
+
+class SQLiteEngine(StorageEngine):
+    """ SQLite engine in WAL mode, shared by every process (and thread)
+    using the same database file.
+    A class is a table with one JSON column holding to_json(True), plus
+    one indexed column for id, created_at, updated_at and every attribute
+    of indexed_attributes; other attributes are searched in the JSON.
+    An empty table imports the objects stored by the source engine (the
+    .db_<Class> files of the file engine).
+    """
+
+    def __init__(self, db_path: str, source: StorageEngine = None):
+        """ Initialize the engine on the database file db_path
+        """
+        self.db_path = db_path
+        self.source = source
+        self._local = threading.local()
+        self._tables = set()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread and process
+        """
+        cnx = getattr(self._local, 'cnx', None)
+        if cnx is None or self._local.pid != os.getpid():
+            cnx = sqlite3.connect(self.db_path, timeout=30,
+                                  isolation_level=None)
+            cnx.execute("PRAGMA journal_mode=WAL")
+            cnx.execute("PRAGMA synchronous=NORMAL")
+            self._local.cnx = cnx
+            self._local.pid = os.getpid()
+        return cnx
+
+    @staticmethod
+    def columns(cls) -> List[str]:
+        """ Return the SQL columns of a class, the JSON one excepted
+        """
+        columns = ['id', 'created_at', 'updated_at']
+        for attr in cls.indexed_attributes:
+            if attr not in columns:
+                columns.append(attr)
+        return columns
+
+    def table(self, cls) -> str:
+        """ Create the table of a class if needed and return its name
+        """
+        name = cls.__name__
+        if name not in self._tables:
+            cnx = self.connection()
+            columns = self.columns(cls)
+            cnx.execute('CREATE TABLE IF NOT EXISTS "{}" ({}, data TEXT '
+                        'NOT NULL)'.format(name, ", ".join(
+                            ['id TEXT PRIMARY KEY'] +
+                            ['"{}"'.format(c) for c in columns[1:]])))
+            for column in columns[2:]:
+                cnx.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_{1}" '
+                            'ON "{0}" ("{1}")'.format(name, column))
+            # order of iterate(), also serving the created_at lookups
+            cnx.execute('CREATE INDEX IF NOT EXISTS "ix_{0}_order" '
+                        'ON "{0}" (created_at, id)'.format(name))
+            self._tables.add(name)
+        return name
+
+    def _row(self, obj: TypeVar('Base')) -> list:
+        """ Return the column values of an object
+        """
+        record = obj.to_json(True)
+        return [record.get(column) for column in self.columns(type(obj))] \
+            + [json.dumps(record)]
+
+    def load(self, cls):
+        """ Create the table and, if it is empty, import the records of
+        the source engine
+        """
+        table = self.table(cls)
+        columns = self.columns(cls)
+        cnx = self.connection()
+        cnx.execute("BEGIN IMMEDIATE")
+        try:
+            count, = cnx.execute('SELECT COUNT(*) FROM "{}"'.format(
+                table)).fetchone()
+            if count == 0 and self.source is not None:
+                cnx.executemany(
+                    'INSERT OR IGNORE INTO "{}" VALUES ({})'.format(
+                        table, ", ".join(["?"] * (len(columns) + 1))),
+                    ([record.get(column) for column in columns]
+                     + [json.dumps(record)] for record
+                     in self.source.read_records(cls).values()))
+            cnx.execute("COMMIT")
+        except Exception:
+            cnx.execute("ROLLBACK")
+            raise
+
+    def snapshot(self, cls):
+        """ Nothing to do: every save is already in the database
+        """
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        row = self.connection().execute(
+            'SELECT data FROM "{}" WHERE id = ?'.format(self.table(cls)),
+            (id,)).fetchone()
+        return cls(**json.loads(row[0])) if row is not None else None
+
+    def _where(self, cls, predicates: List[Predicate]) -> tuple:
+        """ Return the WHERE clauses and parameters of predicates, on the
+        indexed columns when possible, or None when nothing can match
+        """
+        columns = self.columns(cls)
+        clauses = []
+        params = []
+        for predicate in predicates:
+            k = predicate.attribute
+            if k in columns:
+                column, column_params = '"{}"'.format(k), []
+            else:
+                column, column_params = "json_extract(data, ?)", \
+                    ['$."{}"'.format(k)]
+            if isinstance(predicate, Prefix):
+                # numbers sort before any text in SQLite
+                clauses.append("({0} >= ? AND substr({0}, 1, ?) = ?)".format(
+                    column))
+                params.extend(column_params + [predicate.prefix] +
+                              column_params + [len(predicate.prefix),
+                                               predicate.prefix])
+                continue
+            if isinstance(predicate, Equal) and predicate.value is None:
+                clauses.append(column + " IS NULL")
+                params.extend(column_params)
+                continue
+
+            bounds = []
+            for value in predicate.bounds():
+                if type(value) is datetime:
+                    value = format_timestamp(value)
+                if value is not None \
+                        and not isinstance(value, (str, int, float)):
+                    # no stored JSON value can be compared to it
+                    return None
+                bounds.append(value)
+            low, high = bounds
+            if isinstance(predicate, Equal):
+                clauses.append(column + " = ?")
+                params.extend(column_params + [low])
+                continue
+            if low is None and high is None:
+                clauses.append(column + " IS NOT NULL")
+                params.extend(column_params)
+            if low is not None:
+                clauses.append(column + " >= ?")
+                params.extend(column_params + [low])
+            if high is not None:
+                clauses.append(column + " <= ?")
+                params.extend(column_params + [high])
+        return clauses, params
+
+    def _select(self, cls, predicates: List[Predicate], order: str,
+                clauses: List[str] = [], params: list = [],
+                limit: int = None, offset: int = 0) \
+            -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects matching predicates and the extra
+        clauses, in order, reading the rows as they are consumed
+        """
+        table = self.table(cls)
+        where = self._where(cls, predicates)
+        if where is None:
+            return iter([])
+        clauses = where[0] + clauses
+        params = where[1] + params
+        rows = self.connection().execute(
+            'SELECT data FROM "{}"{} ORDER BY {} LIMIT ? OFFSET ?'.format(
+                table, " WHERE " + " AND ".join(clauses) if clauses else "",
+                order),
+            params + [-1 if limit is None else limit, offset])
+        return (cls(**json.loads(data)) for data, in rows)
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return all objects with matching attributes, in insertion
+        order
+        """
+        return list(self._select(cls, [Equal(k, v) for k, v
+                                       in attributes.items()], "rowid"))
+
+    def iterate(self, cls, attributes: dict, after: tuple, limit: int,
+                offset: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes ordered by
+        (created_at, id), reading the rows as they are consumed
+        """
+        clauses = []
+        params = []
+        if after is not None:
+            clauses.append("(created_at, id) > (?, ?)")
+            params.extend([format_timestamp(after[0]), after[1]])
+        return self._select(cls, [Equal(k, v) for k, v in attributes.items()],
+                            "created_at, id", clauses, params, limit, offset)
+
+    def query(self, cls, predicates: List[Predicate]) \
+            -> List[TypeVar('Base')]:
+        """ Return the objects matching every predicate, ordered by
+        (created_at, id)
+        """
+        return list(self._select(cls, predicates, "created_at, id"))
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        count, = self.connection().execute('SELECT COUNT(*) FROM "{}"'.format(
+            self.table(cls))).fetchone()
+        return count
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update an object, keeping its insertion order
+        """
+        cls = type(obj)
+        table = self.table(cls)
+        columns = self.columns(cls) + ['data']
+        self.connection().execute(
+            'INSERT INTO "{}" VALUES ({}) ON CONFLICT(id) DO UPDATE SET {}'
+            .format(table, ", ".join(["?"] * len(columns)), ", ".join(
+                ['"{0}" = excluded."{0}"'.format(c) for c in columns[1:]])),
+            self._row(obj))
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        self.connection().execute('DELETE FROM "{}" WHERE id = ?'.format(
+            self.table(type(obj))), (obj.id,))
+
+
+def get_engine(name: str, db_path: str) -> StorageEngine:
+    """ Return a new engine called name: 'file', or 'sqlite' on the
+    database file db_path
+    """
+    # models.file_engine imports this module
+    from models.file_engine import FileEngine
+
+    if name == 'file':
+        return FileEngine()
+    if name == 'sqlite':
+        return SQLiteEngine(db_path, FileEngine())
+    raise ValueError("unknown storage engine {}".format(name))
@@ -0,0 +1,1197 @@
+#!/usr/bin/env python3
+""" File engine module: the default storage engine of models.base.Base,
+every object held in memory and persisted to the .db_<Class> files
+"""
+from os import getenv, path
+from typing import Iterable, Iterator, List, TypeVar
+import atexit
+import bisect
+import concurrent.futures
+import glob
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+
+from models.columnar import ColumnStore
+from models.engine import StorageEngine
+from models.query import Equal, Predicate
+from models.serializer import (SERIALIZERS, Serializer, at_stored_precision,
+                               get_serializer)
+
+logger = logging.getLogger(__name__)
+
+# value of the hash indexes for an unhashable one, only found by a scan
+_UNINDEXED = object()
+# cache entry being built, dropped if the object is modified meanwhile
+_PENDING = object()
+
+
+class _Top():
+    """ Greater than any id, to bisect after every (value, id) of a value
+    """
+
+    def __lt__(self, other) -> bool:
+        """ Never lower """
+        return False
+
+    def __gt__(self, other) -> bool:
+        """ Always greater """
+        return True
+
+
+_TOP = _Top()
+
+
+def _file_path(s_class: str, serializer: Serializer) -> str:
+    """ Return the path of the main file of a class in a format
+    """
+    return ".db_{}.{}".format(s_class, serializer.extension)
+
+
+def _shard_of(obj_id: str, shards: int) -> int:
+    """ Return the shard of an id among shards
+    """
+    return zlib.crc32(obj_id.encode('utf-8')) % shards
+
+
+def _shard_path(s_class: str, shard: int, serializer: Serializer) -> str:
+    """ Return the path of a shard file of a class in a format
+    """
+    return ".db_{}.{:02d}.{}".format(s_class, shard, serializer.extension)
+
+
+def _shard_files(s_class: str) -> dict:
+    """ Return the shard files of a class on disk, {serializer: paths}
+    """
+    pattern = re.compile(r"\.db_{}\.\d+\.(\w+)$".format(re.escape(s_class)))
+    files = {}
+    for file_path in sorted(glob.glob(".db_{}.[0-9]*.*".format(s_class))):
+        match = pattern.match(file_path)
+        if match is not None and match.group(1) in SERIALIZERS:
+            files.setdefault(SERIALIZERS[match.group(1)], []).append(
+                file_path)
+    return files
+
+
+class FileEngine(StorageEngine):
+    """ FileEngine class: the objects of every class in memory, in
+    self.data[class] = {id: object}, persisted to the .db_<Class> files,
+    which only one process may write. The BASE_* environment variables
+    set its attributes when it is created.
+    """
+
+    def __init__(self):
+        """ Initialize an empty engine configured from the environment
+        """
+        self.data = {}
+
+        # Concurrency: every change of data, raw and the indexes (and the
+        # file writes done in the request) is serialized by write_lock;
+        # readers never take it, they iterate over list() snapshots of the
+        # dictionaries, which are copied atomically, and slice the sorted
+        # indexes under _sorted_lock, which writers only hold while they
+        # change them. In write-behind mode the flusher thread is the
+        # single writer of the files.
+        self.write_lock = threading.RLock()
+        self._sorted_lock = threading.Lock()
+
+        # Format of the main .db_<Class>.<extension> file, see
+        # models.serializer; a file in another format is still loaded
+        # and rewritten in this one by the next snapshot, migrate_file()
+        # (migrate_format.py) converts it at once
+        self.serializer_name = getenv('BASE_SERIALIZER', 'json')
+
+        # Append-only journal: save()/remove() append one line to
+        # .db_<Class>.log instead of rewriting .db_<Class>.json, which is
+        # rewritten (compacted) once the journal holds
+        # journal_compact_ratio times more records than there are objects,
+        # and at least journal_compact_min records
+        self.journal_mode = getenv('BASE_JOURNAL', '0') != '0'
+        self.journal_compact_min = int(getenv('BASE_JOURNAL_COMPACT_MIN',
+                                              1000))
+        self.journal_compact_ratio = float(getenv(
+            'BASE_JOURNAL_COMPACT_RATIO', 2))
+        self.journal_size = {}
+
+        # Secondary hash indexes of the attributes listed in
+        # indexed_attributes: indexes[class][attribute][value] is the id
+        # of the object holding value, or the dict {id: None} of their ids
+        # in the order they took it when several objects share it (the
+        # order search() returns them in), and indexed_values[class][id] the
+        # tuple of the values the object was indexed under, in the order
+        # of indexed_attributes (_UNINDEXED for an unhashable value, only
+        # found by a full scan)
+        self.indexes = {}
+        self.indexed_values = {}
+
+        # Sorted indexes of the attributes listed in sorted_attributes,
+        # serving the range and prefix predicates of query():
+        # sorted[class][attribute] is the sorted list of the (value, id)
+        # of the objects whose value is not None (None if the values
+        # cannot be sorted), built on the first query of the attribute
+        # and then kept up to date, and sorted_values[class][attribute]
+        # [id] the value each object was indexed under. Datetimes are
+        # indexed at their stored precision (whole seconds), so that the
+        # index of created_at follows the order of sort_key() before and
+        # after a restart; the predicates then filter the candidates. An
+        # index is built without any lock: building[class][attribute]
+        # collects the ids of the objects changed meanwhile, indexed again
+        # before the index is published.
+        self.sorted = {}
+        self.sorted_values = {}
+        self.building = {}
+        self._sorted_build_lock = threading.Lock()
+
+        # Columnar mirror (needs numpy): with BASE_COLUMNAR=1, a scan of at
+        # least columnar_min objects that no index serves evaluates its
+        # predicates on NumPy columns of the attributes (see
+        # models.columnar) and only builds the matching objects.
+        # columns[class] is the mirror, built on the first such scan and
+        # then refreshed from the objects assigned or removed.
+        self.columnar = getenv('BASE_COLUMNAR', '0') != '0'
+        self.columnar_min = int(getenv('BASE_COLUMNAR_MIN', 10000))
+        self.columns = {}
+
+        # Lazy loading: load() keeps the records of the file in
+        # raw[class] = {id: record} and an object is only built on its
+        # first get(), or all of them on the first search()/all()
+        self.lazy_load = getenv('BASE_LAZY_LOAD', '0') != '0'
+        self.raw = {}
+
+        # Dirty tracking (opt-in, it keeps one record per object in
+        # memory): records[class][id] caches the to_json(True) record of
+        # a stored object, built by serialized() from the object itself,
+        # and assigning any attribute of the object drops it, so that
+        # snapshots only serialize again the objects modified since the
+        # previous one. A value mutated in place is not seen. The
+        # serializer may also keep, in encoded[class], the encoded form of
+        # the records it can reuse.
+        self.dirty_tracking = getenv('BASE_DIRTY_TRACKING', '0') != '0'
+        self.records = {}
+        self.encoded = {}
+        self._records_lock = threading.Lock()
+
+        # View cache (opt-in, it keeps one record and its bytes per object
+        # viewed): views[class][id] = [to_json() record, its encoded bytes
+        # or None until asked] for the objects held in data, dropped like
+        # records when an attribute is assigned, so that the API does not
+        # format the same unchanged objects on every request
+        self.view_cache = getenv('BASE_VIEW_CACHE', '0') != '0'
+        self.views = {}
+
+        # Durability policy of save()/remove():
+        #   ''         write the file in the request (default)
+        #   'always'   write the file in the request and fsync it
+        #   'interval' write-behind: mark the object dirty, a background
+        #              thread writes the dirty objects in one batch every
+        #              write_behind_interval seconds, or once
+        #              write_behind_max_dirty are pending, and fsyncs the
+        #              batch
+        #   'none'     write-behind without fsync
+        # Pending writes are always flushed at process exit.
+        self.durability = getenv('BASE_DURABILITY', '')
+        self.write_behind_interval = float(getenv(
+            'BASE_WRITE_BEHIND_INTERVAL', 1))
+        self.write_behind_max_dirty = int(getenv(
+            'BASE_WRITE_BEHIND_MAX_DIRTY', 1000))
+        self.dirty = {}
+        self._dirty_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._flusher = None
+
+        # Sharded layout: with shards > 0, the objects of a class are
+        # stored in that many files .db_<Class>.<NN>.<extension>, by
+        # CRC-32 of their id, instead of the main file. A write without
+        # journal only rewrites the shards of the changed objects, and
+        # load() reads the shards in shard_loaders threads.
+        # shard_ids[class][shard] = {id: None} is the membership of each
+        # shard, only set once the files on disk are the shards of this
+        # layout and format: until then (another layout or format on
+        # disk, or no file yet), writes rewrite every file of the class.
+        # reshard() moves the files to another layout.
+        self.shards = int(getenv('BASE_SHARDS', 0))
+        self.shard_loaders = int(getenv('BASE_SHARD_LOADERS', 4))
+        self.shard_ids = {}
+
+        # Snapshots (.db_<Class>.json) are written to a temporary file and
+        # swapped in with os.replace. In journal mode, with
+        # snapshot_fork_min > 0, classes holding at least that many
+        # objects are snapshotted by a forked child process (like Redis
+        # BGSAVE): the journal is rotated to .db_<Class>.log.old, the
+        # child writes the snapshot and drops the old journal, and the
+        # server only pays for the fork. Changes made meanwhile are in the
+        # new journal. One child runs per class; a snapshot asked for
+        # meanwhile runs when it is done. The child takes no lock (another
+        # thread may hold one at fork time). Without the journal,
+        # snapshots are always written in the process: a save must be on
+        # disk when it returns. Duration and size of the last snapshot are
+        # in stats.
+        self.snapshot_fork_min = int(getenv('BASE_SNAPSHOT_FORK_MIN', 0))
+        self.snapshots = {}
+        self.stats = {}
+
+        atexit.register(self.close)
+
+    def close(self):
+        """ Persist everything pending, before the process exits
+        """
+        self.flush()
+        self.finish_snapshots()
+
+    def _prepare(self, cls) -> str:
+        """ Create the empty store of cls on its first use and return the
+        name of the class
+        """
+        s_class = cls.__name__
+        if self.indexes.get(s_class) is None:
+            with self.write_lock:
+                if self.indexes.get(s_class) is None:
+                    self.data.setdefault(s_class, {})
+                    self.indexed_values[s_class] = {}
+                    self.indexes[s_class] = {
+                        attr: {} for attr in cls.indexed_attributes}
+        return s_class
+
+    def _sync(self, f):
+        """ fsync an open file when the durability policy asks for it
+        """
+        if self.durability in ('always', 'interval'):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_file(self, file_path: str, serializer: Serializer,
+                    objs_json: dict, cache: dict = None):
+        """ Write records to a temporary file and swap it in place of
+        file_path
+        """
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            serializer.dump(objs_json, f, cache)
+            self._sync(f)
+        os.replace(tmp_path, file_path)
+
+    def _encoded_cache(self, key) -> dict:
+        """ Return the encoded cache of a file, or None without dirty
+        tracking
+        """
+        if not self.dirty_tracking:
+            return None
+        return self.encoded.setdefault(key, {})
+
+    def touch(self, obj: TypeVar('Base')):
+        """ Drop what is cached for obj, one of its attributes was
+        assigned
+        """
+        s_class = obj.__class__.__name__
+        records = self.records.get(s_class)
+        if records and getattr(obj, 'id', None) in records:
+            with self._records_lock:
+                records.pop(obj.id, None)
+        views = self.views.get(s_class)
+        if views and getattr(obj, 'id', None) in views:
+            with self._records_lock:
+                views.pop(obj.id, None)
+        store = self.columns.get(s_class)
+        if store is not None and hasattr(obj, 'id'):
+            store.touch(obj.id)
+
+    def serialized(self, obj: TypeVar('Base')) -> dict:
+        """ Return the to_json(True) record of obj, cached until the object
+        is modified when dirty_tracking is on and obj is the one stored
+        """
+        s_class = obj.__class__.__name__
+        obj_id = getattr(obj, 'id', None)
+        if not self.dirty_tracking or \
+                self.data.get(s_class, {}).get(obj_id) is not obj:
+            return obj.build_json(True)
+        records = self.records.setdefault(s_class, {})
+        record = records.get(obj_id)
+        if record is not None and record is not _PENDING:
+            return record
+        with self._records_lock:
+            records[obj_id] = _PENDING
+        record = obj.build_json(True)
+        with self._records_lock:
+            # unless modified meanwhile
+            if records.get(obj_id) is _PENDING:
+                records[obj_id] = record
+        return record
+
+    def view(self, obj: TypeVar('Base')) -> list:
+        """ Return the [to_json() record, encoded bytes or None] cached
+        for obj, or None without view_cache or if it is not the one stored
+        """
+        s_class = obj.__class__.__name__
+        obj_id = getattr(obj, 'id', None)
+        objs = self.data.get(s_class, {})
+        if not self.view_cache or objs.get(obj_id) is not obj:
+            return None
+        views = self.views.setdefault(s_class, {})
+        view = views.get(obj_id)
+        if view is not None and view is not _PENDING:
+            return view
+        with self._records_lock:
+            views[obj_id] = _PENDING
+        view = [obj.build_json(False), None]
+        with self._records_lock:
+            # unless modified or replaced meanwhile
+            if views.get(obj_id) is _PENDING and objs.get(obj_id) is obj:
+                views[obj_id] = view
+        return view
+
+    def load(self, cls):
+        """ Load all objects of cls from file, then replay the journal over
+        them
+        """
+        s_class = cls.__name__
+        with self.write_lock:
+            self.data[s_class] = {}
+            self.raw[s_class] = {}
+            self.records[s_class] = {}
+            self.views[s_class] = {}
+            for key in [key for key in self.encoded
+                        if key == s_class or key[0] == s_class]:
+                del self.encoded[key]
+            self.journal_size[s_class] = 0
+            self.raw[s_class] = self.read_records(cls)
+            self.shard_ids.pop(s_class, None)
+            if self.shards > 0 and self.sharded_on_disk(cls):
+                self.rebuild_shards(cls)
+            self.rebuild_indexes(cls)
+            if not self.lazy_load:
+                self.materialize(cls)
+
+    def read_records(self, cls) -> dict:
+        """ Return the records of the main file of cls with the journal
+        replayed over them
+        """
+        s_class = cls.__name__
+        serializer = get_serializer(self.serializer_name)
+        if not path.exists(_file_path(s_class, serializer)):
+            # fall back on a file written in another format
+            for other in SERIALIZERS.values():
+                if path.exists(_file_path(s_class, other)):
+                    serializer = other
+        file_path = _file_path(s_class, serializer)
+        shard_files = _shard_files(s_class)
+        self.raw[s_class] = {}
+        if shard_files and (self.shards > 0 or not path.exists(file_path)):
+            # the configured layout first, then whichever exists
+            shard_serializer = get_serializer(self.serializer_name)
+            if shard_serializer not in shard_files:
+                shard_serializer = next(iter(shard_files))
+            self.raw[s_class] = self.read_shards(
+                shard_files[shard_serializer], shard_serializer)
+        elif path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                self.raw[s_class] = serializer.load(f)
+        self.replay_journal(cls)
+        return self.raw.pop(s_class)
+
+    def read_shards(self, file_paths: List[str],
+                    serializer: Serializer) -> dict:
+        """ Return the records of shard files, read in shard_loaders
+        threads
+        """
+        def _read(file_path):
+            with open(file_path, 'rb') as f:
+                return serializer.load(f)
+
+        records = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(self.shard_loaders, 1)) as executor:
+            for shard_records in executor.map(_read, file_paths):
+                records.update(shard_records)
+        return records
+
+    def sharded_on_disk(self, cls) -> bool:
+        """ Tell whether the files of cls on disk are exactly the shard
+        files of the configured layout and format, which write_shards()
+        may then rewrite one at a time
+        """
+        s_class = cls.__name__
+        serializer = get_serializer(self.serializer_name)
+        shard_files = _shard_files(s_class)
+        main_files = [other for other in SERIALIZERS.values()
+                      if path.exists(_file_path(s_class, other))]
+        if not shard_files and not main_files:
+            # nothing stored yet
+            return False
+        if list(shard_files) == [serializer] and not main_files and set(
+                shard_files[serializer]) == {
+                    _shard_path(s_class, shard, serializer)
+                    for shard in range(self.shards)}:
+            return True
+        logger.warning("%s is not stored in %d %s shards, its files are "
+                       "rewritten on its first write", s_class, self.shards,
+                       serializer.extension)
+        return False
+
+    def rebuild_shards(self, cls):
+        """ Assign again every object of cls to its shard
+        """
+        s_class = self._prepare(cls)
+        with self.write_lock:
+            shards = [{} for _ in range(self.shards)]
+            for obj_id in list(self.data[s_class]) + \
+                    list(self.raw.get(s_class, {})):
+                shards[_shard_of(obj_id, self.shards)][obj_id] = None
+            self.shard_ids[s_class] = shards
+
+    def materialize(self, cls, obj_id: str = None):
+        """ Build the objects of cls still held as raw records, or only
+        the one of obj_id
+        """
+        s_class = self._prepare(cls)
+        raw = self.raw.get(s_class)
+        if not raw or (obj_id is not None and obj_id not in raw):
+            return
+        with self.write_lock:
+            raw = self.raw.get(s_class, {})
+            if obj_id is not None:
+                obj_ids = [obj_id] if obj_id in raw else []
+            else:
+                obj_ids = list(raw.keys())
+            for obj_id in obj_ids:
+                record = raw.pop(obj_id)
+                obj = cls(**record)
+                self.data[s_class][obj_id] = obj
+                if self.columns.get(s_class) is not None:
+                    self.columns[s_class].add(obj_id)
+                self.update_indexes(obj)
+
+    def replay_journal(self, cls):
+        """ Apply the records of the journal files of cls to its raw
+        records
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.log".format(s_class)
+        for file_path in (journal_path + ".old", journal_path):
+            if not path.exists(file_path):
+                continue
+
+            complete = 0
+            with open(file_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # torn last line of an interrupted append
+                        break
+                    complete += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get('op') == 'save':
+                        self.raw[s_class][record['obj']['id']] = \
+                            record['obj']
+                    else:
+                        self.raw[s_class].pop(record.get('id'), None)
+                    self.journal_size[s_class] = \
+                        self.journal_size.get(s_class, 0) + 1
+            if complete < path.getsize(file_path):
+                # cut it off, the next append would extend it
+                os.truncate(file_path, complete)
+
+    def snapshot(self, cls):
+        """ Save all objects of cls to file, and drop the journal it now
+        contains
+        """
+        s_class = self._prepare(cls)
+        if self.shards > 0:
+            self.rebuild_shards(cls)
+        if self.snapshot_fork_min > 0 and self.journal_mode \
+                and hasattr(os, 'fork') \
+                and self.count(cls) >= self.snapshot_fork_min:
+            self.background_save(cls)
+            return
+
+        if self.snapshots.get(s_class) is not None:
+            # an older snapshot must not replace this one
+            self.snapshots[s_class]['pending'] = False
+            self.reap_snapshot(cls, block=True)
+        journal_path = ".db_{}.log".format(s_class)
+        self.stats[s_class] = self.write_snapshot(
+            cls, [journal_path + ".old", journal_path])
+        self.journal_size[s_class] = 0
+
+    def write_snapshot(self, cls, journals: List[str],
+                       forked: bool = False) -> dict:
+        """ Write all objects of cls to temporary files, swap them in place
+        of the main file (or shards), remove the journals they contain and
+        return their stats
+        In a forked child, the records are read from records or built
+        without taking _records_lock.
+        """
+        s_class = cls.__name__
+        start = time.perf_counter()
+        objs_json = dict(self.raw.get(s_class, {}))
+        records = self.records.get(s_class, {})
+        for obj_id, obj in list(self.data[s_class].items()):
+            if not forked:
+                objs_json[obj_id] = self.serialized(obj)
+                continue
+            record = records.get(obj_id)
+            if record is None or record is _PENDING:
+                record = obj.build_json(True)
+            objs_json[obj_id] = record
+        size = self.write_files(cls, objs_json, self.shards)
+
+        for journal_path in journals:
+            if path.exists(journal_path):
+                os.remove(journal_path)
+        return {
+            'objects': len(objs_json),
+            'size': size,
+            'duration': time.perf_counter() - start,
+            'forked': forked,
+        }
+
+    def write_files(self, cls, objs_json: dict, shards: int) -> int:
+        """ Write all records of cls in the layout of shards files (0 for
+        the main file), remove the files of any other layout or format and
+        return the size written
+        """
+        s_class = cls.__name__
+        serializer = get_serializer(self.serializer_name)
+        if shards > 0:
+            partition = [{} for _ in range(shards)]
+            for obj_id, record in objs_json.items():
+                partition[_shard_of(obj_id, shards)][obj_id] = record
+            file_paths = [_shard_path(s_class, shard, serializer)
+                          for shard in range(shards)]
+            for shard, file_path in enumerate(file_paths):
+                self._write_file(file_path, serializer, partition[shard],
+                                 self._encoded_cache((s_class, shard)))
+        else:
+            file_paths = [_file_path(s_class, serializer)]
+            self._write_file(file_paths[0], serializer, objs_json,
+                             self._encoded_cache(s_class))
+
+        for other in SERIALIZERS.values():
+            # the file in the previous format or layout is now outdated
+            if (other is not serializer or shards > 0) \
+                    and path.exists(_file_path(s_class, other)):
+                os.remove(_file_path(s_class, other))
+        for other_paths in _shard_files(s_class).values():
+            for file_path in other_paths:
+                if file_path not in file_paths:
+                    os.remove(file_path)
+        return sum([path.getsize(file_path) for file_path in file_paths])
+
+    def write_shards(self, cls, shards: Iterable[int]):
+        """ Rewrite the given shard files of cls from the objects they hold
+        """
+        s_class = cls.__name__
+        while self.snapshots.get(s_class) is not None:
+            # a snapshot child must not replace them with older ones
+            self.reap_snapshot(cls, block=True)
+        serializer = get_serializer(self.serializer_name)
+        objs = self.data[s_class]
+        raw = self.raw.get(s_class, {})
+        for shard in shards:
+            objs_json = {}
+            for obj_id in list(self.shard_ids[s_class][shard]):
+                obj = objs.get(obj_id)
+                if obj is not None:
+                    objs_json[obj_id] = self.serialized(obj)
+                elif obj_id in raw:
+                    objs_json[obj_id] = raw[obj_id]
+            self._write_file(_shard_path(s_class, shard, serializer),
+                             serializer, objs_json,
+                             self._encoded_cache((s_class, shard)))
+
+    def reshard(self, cls, shards: int):
+        """ Move the stored objects of cls, from whatever layout is on
+        disk, to shards shard files (0 for the main file)
+        Meant for maintenance with the server stopped; set BASE_SHARDS to
+        the new layout before restarting it.
+        """
+        s_class = cls.__name__
+        with self.write_lock:
+            journal_path = ".db_{}.log".format(s_class)
+            self.journal_size[s_class] = 0
+            self.write_files(cls, self.read_records(cls), shards)
+            for file_path in (journal_path + ".old", journal_path):
+                if path.exists(file_path):
+                    os.remove(file_path)
+
+    def migrate_file(self, cls, target: str = None) -> int:
+        """ Convert the stored objects of cls, from whatever format is on
+        disk, to the target serializer (by default the configured one),
+        keeping their layout, and return that layout (see reshard())
+        Meant for maintenance with the server stopped; set BASE_SERIALIZER
+        to target before restarting it.
+        """
+        s_class = cls.__name__
+        target = get_serializer(target or self.serializer_name).name
+        shard_files = _shard_files(s_class)
+        shards = 0
+        if shard_files and not any(path.exists(_file_path(s_class, other))
+                                   for other in SERIALIZERS.values()):
+            shards = max([len(file_paths)
+                          for file_paths in shard_files.values()])
+        with self.write_lock:
+            serializer_name = self.serializer_name
+            self.serializer_name = target
+            try:
+                self.reshard(cls, shards)
+            finally:
+                self.serializer_name = serializer_name
+        return shards
+
+    def background_save(self, cls):
+        """ Snapshot all objects of cls from a forked child process
+        """
+        s_class = cls.__name__
+        self.reap_snapshot(cls)
+        if self.snapshots.get(s_class) is not None:
+            self.snapshots[s_class]['pending'] = True
+            return
+
+        journal_path = ".db_{}.log".format(s_class)
+        old_journal_path = journal_path + ".old"
+        # no change between the rotation and the fork: the child must see
+        # every change of the old journal and none of the new one
+        with self.write_lock:
+            if path.exists(old_journal_path):
+                # left by a failed child: append the current journal to it
+                if path.exists(journal_path):
+                    with open(journal_path, 'r') as src, \
+                            open(old_journal_path, 'a') as dst:
+                        dst.write(src.read())
+                    os.remove(journal_path)
+            elif path.exists(journal_path):
+                os.replace(journal_path, old_journal_path)
+            self.journal_size[s_class] = 0
+
+            start = time.perf_counter()
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            status = 1
+            try:
+                stats = self.write_snapshot(cls, [old_journal_path],
+                                            forked=True)
+                os.write(write_fd, json.dumps(stats).encode())
+                status = 0
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        self.snapshots[s_class] = {
+            'cls': cls,
+            'pid': pid,
+            'fd': read_fd,
+            'fork_duration': time.perf_counter() - start,
+            'pending': False,
+        }
+
+    def reap_snapshot(self, cls, block: bool = False):
+        """ Collect the stats of a finished snapshot child of cls (waiting
+        for it with block), and start the snapshot asked for while it was
+        running
+        """
+        s_class = cls.__name__
+        snapshot = self.snapshots.get(s_class)
+        if snapshot is None:
+            return
+        pid, status = os.waitpid(snapshot['pid'], 0 if block else os.WNOHANG)
+        if pid == 0:
+            return
+
+        with os.fdopen(snapshot['fd'], 'r') as f:
+            output = f.read()
+        del self.snapshots[s_class]
+        if status == 0 and output:
+            stats = json.loads(output)
+            stats['fork_duration'] = snapshot['fork_duration']
+            self.stats[s_class] = stats
+        if snapshot['pending']:
+            self.background_save(cls)
+
+    def finish_snapshots(self):
+        """ Wait for the snapshot children, then write the snapshots still
+        pending
+        """
+        for s_class, snapshot in list(self.snapshots.items()):
+            # reaping may start the pending snapshot in a new child
+            while self.snapshots.get(s_class) is not None:
+                self.reap_snapshot(snapshot['cls'], block=True)
+
+    def snapshot_stats(self, cls) -> dict:
+        """ Return the stats of the last snapshot of cls: objects, size in
+        bytes, duration in seconds, forked and, if so, fork_duration
+        """
+        self.reap_snapshot(cls)
+        return dict(self.stats.get(cls.__name__, {}))
+
+    def append_to_journal(self, cls, records: List[dict]):
+        """ Append save/remove records to the journal file of cls, and
+        compact the journal into the main file when it has grown too long
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.log".format(s_class)
+        with open(journal_path, 'a') as f:
+            f.write("".join([json.dumps(record) + "\n"
+                             for record in records]))
+            self._sync(f)
+
+        size = self.journal_size.get(s_class, 0) + len(records)
+        self.journal_size[s_class] = size
+        if size >= self.journal_compact_min and \
+                size >= self.journal_compact_ratio * self.count(cls):
+            self.snapshot(cls)
+
+    def write_changes(self, cls, changes: dict):
+        """ Persist changes of cls, {id: saved object, or None if removed}
+        """
+        if self.journal_mode:
+            self.append_to_journal(cls, [
+                {'op': 'remove', 'id': obj_id} if obj is None
+                else {'op': 'save', 'obj': self.serialized(obj)}
+                for obj_id, obj in changes.items()])
+        elif self.shards > 0 and cls.__name__ in self.shard_ids:
+            self.write_shards(cls, sorted({_shard_of(obj_id, self.shards)
+                                           for obj_id in changes}))
+        else:
+            self.snapshot(cls)
+
+    def write(self, cls, obj_id: str, obj: TypeVar('Base')):
+        """ Persist one saved (or removed, obj None) object now, or mark
+        it dirty for the background flusher in write-behind mode
+        """
+        if self.durability not in ('interval', 'none'):
+            self.write_changes(cls, {obj_id: obj})
+            return
+
+        with self._dirty_lock:
+            self.dirty.setdefault(cls, {})[obj_id] = obj
+            pending = sum([len(changes) for changes in self.dirty.values()])
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flusher_loop,
+                                                 name="base-flusher",
+                                                 daemon=True)
+                self._flusher.start()
+        if pending >= self.write_behind_max_dirty:
+            self._flush_requested.set()
+
+    def _flusher_loop(self):
+        """ Background thread of the write-behind mode
+        """
+        while True:
+            self._flush_requested.wait(self.write_behind_interval)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except Exception:
+                # the changes are back in dirty, retried on the next round
+                logger.exception("write-behind flush failed")
+
+    def flush(self):
+        """ Write every pending write-behind change now
+        On failure, the changes not written go back to dirty (under the
+        ones made meanwhile) and the error is raised.
+        """
+        with self._flush_lock:
+            with self._dirty_lock:
+                dirty = dict(self.dirty)
+                self.dirty.clear()
+            for cls in list(dirty):
+                try:
+                    self.write_changes(cls, dirty[cls])
+                except BaseException:
+                    with self._dirty_lock:
+                        for cls, changes in dirty.items():
+                            changes = dict(changes)
+                            changes.update(self.dirty.get(cls, {}))
+                            self.dirty[cls] = changes
+                    raise
+                del dirty[cls]
+
+    def rebuild_indexes(self, cls):
+        """ Index again every object of cls
+        """
+        s_class = cls.__name__
+        with self.write_lock:
+            self.data.setdefault(s_class, {})
+            self.indexes[s_class] = {attr: {} for attr
+                                     in cls.indexed_attributes}
+            self.indexed_values[s_class] = {}
+            with self._sorted_lock:
+                self.sorted.pop(s_class, None)
+                self.sorted_values.pop(s_class, None)
+                self.building.pop(s_class, None)
+            self.columns.pop(s_class, None)
+            for obj in self.data[s_class].values():
+                self.update_indexes(obj)
+
+    def _sorted_insert(self, s_class: str, attr: str, obj):
+        """ Add an object to the sorted index of attr
+        """
+        value = at_stored_precision(getattr(obj, attr, None))
+        if value is None:
+            return
+        try:
+            bisect.insort(self.sorted[s_class][attr], (value, obj.id))
+        except TypeError:
+            # not comparable with the other values, only scanned
+            return
+        self.sorted_values[s_class][attr][obj.id] = value
+
+    def _sorted_remove(self, s_class: str, attr: str, obj_id: str):
+        """ Remove the object of obj_id from the sorted index of attr
+        """
+        value = self.sorted_values[s_class][attr].pop(obj_id, None)
+        if value is None:
+            return
+        entries = self.sorted[s_class][attr]
+        i = bisect.bisect_left(entries, (value, obj_id))
+        if i < len(entries) and entries[i] == (value, obj_id):
+            del entries[i]
+
+    def sorted_index(self, cls, attr: str) -> list:
+        """ Return the sorted index of attr, built if needed, or None if
+        its values cannot be sorted
+        The objects are read and sorted without holding write_lock; the
+        objects changed meanwhile are indexed again before publication.
+        """
+        s_class = self._prepare(cls)
+        indexes = self.sorted.get(s_class, {})
+        if attr in indexes:
+            return indexes[attr]
+        with self._sorted_build_lock:
+            # writers change data before they take _sorted_lock to note
+            # the change, so each change is either in items or in changed
+            with self._sorted_lock:
+                indexes = self.sorted.setdefault(s_class, {})
+                if attr in indexes:
+                    return indexes[attr]
+                changed = set()
+                self.building.setdefault(s_class, {})[attr] = changed
+                objs = self.data[s_class]
+                items = list(objs.items())
+
+            entries = [(at_stored_precision(getattr(obj, attr, None)),
+                        obj_id) for obj_id, obj in items]
+            entries = [entry for entry in entries if entry[0] is not None]
+            try:
+                entries.sort()
+            except TypeError:
+                # values not comparable with each other, not indexed
+                entries = None
+
+            with self._sorted_lock:
+                if self.building.get(s_class, {}).get(attr) is not changed:
+                    # rebuild_indexes() ran meanwhile
+                    return None
+                del self.building[s_class][attr]
+                indexes = self.sorted.setdefault(s_class, {})
+                indexes[attr] = entries
+                if entries is None:
+                    return None
+                self.sorted_values.setdefault(s_class, {})[attr] = {
+                    obj_id: value for value, obj_id in entries}
+                for obj_id in changed:
+                    self._sorted_remove(s_class, attr, obj_id)
+                    if obj_id in objs:
+                        self._sorted_insert(s_class, attr, objs[obj_id])
+                return entries
+
+    def update_indexes(self, obj: TypeVar('Base')):
+        """ Index obj under the current value of its attributes, in the
+        place it already holds among the objects sharing a value it kept
+        """
+        s_class = obj.__class__.__name__
+        previous = self.indexed_values[s_class].pop(obj.id, None)
+        values = []
+        for i, (attr, index) in enumerate(self.indexes[s_class].items()):
+            value = getattr(obj, attr, None)
+            if previous is not None:
+                if previous[i] is not _UNINDEXED and previous[i] == value:
+                    values.append(previous[i])
+                    continue
+                self._unindex(index, previous[i], obj.id)
+            try:
+                obj_ids = index.get(value)
+            except TypeError:
+                # unhashable value, only found by a full scan
+                values.append(_UNINDEXED)
+                continue
+            if obj_ids is None:
+                index[value] = obj.id
+            elif type(obj_ids) is dict:
+                obj_ids[obj.id] = None
+            else:
+                index[value] = {obj_ids: None, obj.id: None}
+            values.append(value)
+        self.indexed_values[s_class][obj.id] = tuple(values)
+
+        with self._sorted_lock:
+            self._drop_from_sorted(s_class, obj.id)
+            for attr, entries in self.sorted.get(s_class, {}).items():
+                if entries is not None:
+                    self._sorted_insert(s_class, attr, obj)
+
+    @staticmethod
+    def _unindex(index: dict, value, obj_id: str):
+        """ Remove the id of an object from the hash index entry of value
+        """
+        if value is _UNINDEXED:
+            return
+        obj_ids = index.get(value)
+        if type(obj_ids) is dict:
+            obj_ids.pop(obj_id, None)
+            if len(obj_ids) == 1:
+                index[value] = next(iter(obj_ids))
+        elif obj_ids == obj_id:
+            del index[value]
+
+    def _drop_from_sorted(self, s_class: str, obj_id: str):
+        """ Remove the object of obj_id from the sorted indexes, and from
+        the ones being built, under _sorted_lock
+        """
+        for changed in self.building.get(s_class, {}).values():
+            changed.add(obj_id)
+        for attr, entries in self.sorted.get(s_class, {}).items():
+            if entries is not None:
+                self._sorted_remove(s_class, attr, obj_id)
+
+    def drop_from_indexes(self, obj: TypeVar('Base')):
+        """ Remove obj from the indexes
+        """
+        s_class = obj.__class__.__name__
+        values = self.indexed_values[s_class].pop(obj.id, ())
+        for index, value in zip(self.indexes[s_class].values(), values):
+            self._unindex(index, value, obj.id)
+        with self._sorted_lock:
+            self._drop_from_sorted(s_class, obj.id)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update an object
+        """
+        cls = obj.__class__
+        s_class = self._prepare(cls)
+        with self.write_lock:
+            if self.columns.get(s_class) is not None:
+                # an assignment may have raced with the build of the store
+                if obj.id not in self.data[s_class]:
+                    self.columns[s_class].add(obj.id)
+                else:
+                    self.columns[s_class].touch(obj.id)
+            self.data[s_class][obj.id] = obj
+            # cached for the object it replaces, if any
+            self.views.get(s_class, {}).pop(obj.id, None)
+            self.raw.get(s_class, {}).pop(obj.id, None)
+            if self.shard_ids.get(s_class) is not None:
+                self.shard_ids[s_class][_shard_of(obj.id, self.shards)][
+                    obj.id] = None
+            self.update_indexes(obj)
+            self.write(cls, obj.id, obj)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete an object
+        """
+        cls = obj.__class__
+        s_class = self._prepare(cls)
+        self.materialize(cls, obj.id)
+        with self.write_lock:
+            if self.data[s_class].get(obj.id) is not None:
+                del self.data[s_class][obj.id]
+                self.records.get(s_class, {}).pop(obj.id, None)
+                self.views.get(s_class, {}).pop(obj.id, None)
+                if self.columns.get(s_class) is not None:
+                    self.columns[s_class].touch(obj.id)
+                if self.shard_ids.get(s_class) is not None:
+                    self.shard_ids[s_class][_shard_of(
+                        obj.id, self.shards)].pop(obj.id, None)
+                self.drop_from_indexes(obj)
+                self.write(cls, obj.id, None)
+
+    def count(self, cls) -> int:
+        """ Count all objects
+        """
+        s_class = self._prepare(cls)
+        return len(self.data[s_class].keys()) + \
+            len(self.raw.get(s_class, {}))
+
+    def get(self, cls, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        s_class = self._prepare(cls)
+        self.materialize(cls, id)
+        return self.data[s_class].get(id)
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return all objects with matching attributes
+        When every attribute is indexed, the objects come from the index
+        of the most selective one instead of a scan of all objects.
+        """
+        return list(self.scan(cls, attributes))
+
+    def scan(self, cls, attributes: dict = {}) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes, in the
+        order of search()
+        """
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        _, objs = self.plan(cls, [Equal(k, v) for k, v
+                                  in attributes.items()], ranges=False)
+        return filter(_search, objs)
+
+    def plan(self, cls, predicates: List[Predicate], ranges: bool = True) \
+            -> tuple:
+        """ Pick the access path to the objects matching predicates: the
+        hash index (equality) or, with ranges, the sorted index (equality,
+        range and prefix) giving the fewest candidates, else the scan of
+        all objects, evaluated on the columnar mirror when enabled.
+        Return its description and the candidates
+        """
+        s_class = self._prepare(cls)
+        self.materialize(cls)
+        if ranges:
+            for predicate in predicates:
+                if predicate.attribute in cls.sorted_attributes:
+                    self.sorted_index(cls, predicate.attribute)
+        best = ("scan", None)
+        size = len(self.data[s_class])
+        indexes = self.indexes.get(s_class, {})
+        for predicate in predicates:
+            attr = predicate.attribute
+            if isinstance(predicate, Equal) and attr in indexes:
+                try:
+                    obj_ids = indexes[attr].get(predicate.value)
+                except TypeError:
+                    # unhashable value
+                    obj_ids = _UNINDEXED
+                if obj_ids is None:
+                    obj_ids = ()
+                elif type(obj_ids) is dict:
+                    # in the order the objects took the value
+                    obj_ids = tuple(obj_ids)
+                elif obj_ids is not _UNINDEXED:
+                    obj_ids = (obj_ids,)
+                if obj_ids is not _UNINDEXED and len(obj_ids) < size:
+                    best = ("hash index " + attr, obj_ids)
+                    size = len(obj_ids)
+            if not ranges or attr not in cls.sorted_attributes or (
+                    isinstance(predicate, Equal) and predicate.value is None):
+                # None values are not in the sorted indexes
+                continue
+            low, high = [at_stored_precision(bound)
+                         for bound in predicate.bounds()]
+            # only held to bisect and slice the index
+            with self._sorted_lock:
+                entries = self.sorted.get(s_class, {}).get(attr)
+                if entries is None:
+                    continue
+                try:
+                    start = 0 if low is None \
+                        else bisect.bisect_left(entries, (low,))
+                    end = len(entries) if high is None \
+                        else bisect.bisect_right(entries, (high, _TOP))
+                except TypeError:
+                    # bound not comparable with the values
+                    continue
+                if end - start < size:
+                    best = ("sorted index " + attr,
+                            [obj_id for _, obj_id in entries[start:end]])
+                    size = max(end - start, 0)
+
+        path, objs = best
+        if objs is not None:
+            # ids of the index, unless removed meanwhile
+            candidates = [obj for obj in map(self.data[s_class].get, objs)
+                          if obj is not None]
+        else:
+            objs = self.data[s_class]
+            obj_ids = None
+            if self.columnar and len(predicates) > 0 \
+                    and size >= self.columnar_min:
+                obj_ids = self.column_store(cls).select(predicates, objs)
+            if obj_ids is None:
+                candidates = list(objs.values())
+            else:
+                path = "columnar scan"
+                candidates = [obj for obj in map(objs.get, obj_ids)
+                              if obj is not None]
+                size = len(candidates)
+        return "{} ({} candidates)".format(path, size), candidates
+
+    def column_store(self, cls) -> ColumnStore:
+        """ Return the columnar mirror of cls, built if needed
+        """
+        s_class = self._prepare(cls)
+        store = self.columns.get(s_class)
+        if store is None:
+            # no object may be saved between the build and the publication
+            with self.write_lock:
+                store = self.columns.get(s_class)
+                if store is None:
+                    store = ColumnStore(self.data[s_class])
+                    self.columns[s_class] = store
+        return store
+
+    def query(self, cls, predicates: List[Predicate]) \
+            -> List[TypeVar('Base')]:
+        """ Return the objects matching every predicate, ordered by
+        (created_at, id)
+        The candidates come from the access path picked by plan() and the
+        predicates filter them.
+        """
+        _, objs = self.plan(cls, list(predicates))
+        objs = [obj for obj in objs
+                if all(predicate.matches(getattr(obj, predicate.attribute,
+                                                 None))
+                       for predicate in predicates)]
+        objs.sort(key=cls.sort_key)
+        return objs
+
+    def iterate(self, cls, attributes: dict, after: tuple, limit: int,
+                offset: int) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects with matching attributes ordered by
+        (created_at, id), from the first one after the key after (if not
+        None), skipping offset of them and yielding at most limit
+        """
+        s_class = self._prepare(cls)
+        if not attributes and 'created_at' in cls.sorted_attributes:
+            # the sorted index of created_at is in the page order
+            self.materialize(cls)
+            self.sorted_index(cls, 'created_at')
+            # held while the page is read from the index, not write_lock
+            with self._sorted_lock:
+                entries = self.sorted.get(s_class, {}).get('created_at')
+                if entries is not None:
+                    start = offset if after is None \
+                        else bisect.bisect_right(entries, after) + offset
+                    objs = self.data[s_class]
+                    page = []
+                    for i in range(start, len(entries)):
+                        if limit is not None and len(page) == limit:
+                            break
+                        obj = objs.get(entries[i][1])
+                        if obj is not None:
+                            # else being removed, still indexed
+                            page.append(obj)
+                    return iter(page)
+
+        objs = self.scan(cls, attributes)
+        if after is not None:
+            objs = (obj for obj in objs if obj.sort_key() > after)
+        if limit is None:
+            page = sorted(objs, key=cls.sort_key)
+        else:
+            page = heapq.nsmallest(offset + limit, objs, key=cls.sort_key)
+        return iter(page[offset:])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+""" Query module: predicates of Base.query()
+"""
+from typing import Any
+
+
+class Predicate():
+    """ Predicate class: condition on the value of one attribute
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize a predicate on attribute
+        """
+        self.attribute = attribute
+
+    def matches(self, value: Any) -> bool:
+        """ Return True if value satisfies the predicate
+        """
+        raise NotImplementedError()
+
+    def bounds(self) -> tuple:
+        """ Return the (low, high) inclusive range of a sorted index that
+        holds every matching value, None meaning unbounded
+        """
+        raise NotImplementedError()
+
+
+class Equal(Predicate):
+    """ attribute == value
+    """
+
+    def __init__(self, attribute: str, value: Any):
+        """ Initialize the predicate
+        """
+        super().__init__(attribute)
+        self.value = value
+
+    def matches(self, value: Any) -> bool:
+        """ Return True if value is equal
+        """
+        return value == self.value
+
+    def bounds(self) -> tuple:
+        """ Return the range holding only the value
+        """
+        return (self.value, self.value)
+
+
+class Between(Predicate):
+    """ low <= attribute <= high, a None bound being open
+    """
+
+    def __init__(self, attribute: str, low: Any = None, high: Any = None):
+        """ Initialize the predicate
+        """
+        super().__init__(attribute)
+        self.low = low
+        self.high = high
+
+    def matches(self, value: Any) -> bool:
+        """ Return True if value is in the range
+        """
+        if value is None:
+            return False
+        try:
+            return (self.low is None or value >= self.low) and \
+                (self.high is None or value <= self.high)
+        except TypeError:
+            return False
+
+    def bounds(self) -> tuple:
+        """ Return the range
+        """
+        return (self.low, self.high)
+
+
+class Prefix(Predicate):
+    """ attribute is a string starting with prefix
+    """
+
+    def __init__(self, attribute: str, prefix: str):
+        """ Initialize the predicate
+        """
+        super().__init__(attribute)
+        self.prefix = prefix
+
+    def matches(self, value: Any) -> bool:
+        """ Return True if value starts with the prefix
+        """
+        return isinstance(value, str) and value.startswith(self.prefix)
+
+    def bounds(self) -> tuple:
+        """ Return the range of the strings starting with the prefix
+        """
+        return (self.prefix, self.prefix + chr(0x10ffff))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+""" Serializer module: file formats of the Base persistence
+"""
+from datetime import datetime
+from typing import BinaryIO
+import json
+import marshal
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string, with fromisoformat instead of
+    the much slower strptime whenever the string has the exact shape
+    """
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime as TIMESTAMP_FORMAT, with isoformat instead of
+    strftime whenever both give the same string
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def at_stored_precision(value):
+    """ Return value at the precision it is stored with: a datetime is
+    truncated to the whole seconds of TIMESTAMP_FORMAT
+    """
+    if type(value) is datetime:
+        return value.replace(microsecond=0)
+    return value
+
+
+class Serializer():
+    """ Serializer class: writes and reads the {id: record} dictionary
+    of a class to and from a binary file
+    """
+    name = None
+    extension = None
+
+    def dump(self, objs_json: dict, f: BinaryIO, cache: dict = None):
+        """ Write the records to f; cache, if given, may keep what the
+        serializer can reuse for the same record objects next time
+        """
+        raise NotImplementedError()
+
+    def load(self, f: BinaryIO) -> dict:
+        """ Read the records from f
+        """
+        raise NotImplementedError()
+
+
+class JSONSerializer(Serializer):
+    """ Standard library JSON, the historical .db_<Class>.json format
+    """
+    name = "json"
+    extension = "json"
+
+    def dump(self, objs_json: dict, f: BinaryIO, cache: dict = None):
+        """ Write the records to f as JSON, reusing from cache the text
+        of the records already encoded by the previous dump
+        """
+        if cache is None:
+            f.write(json.dumps(objs_json).encode('utf-8'))
+            return
+        previous = dict(cache)
+        cache.clear()
+        parts = []
+        for key, record in objs_json.items():
+            entry = previous.get(key)
+            if entry is None or entry[0] is not record:
+                entry = (record, json.dumps(key) + ": " + json.dumps(record))
+            cache[key] = entry
+            parts.append(entry[1])
+        f.write(("{" + ", ".join(parts) + "}").encode('utf-8'))
+
+    def load(self, f: BinaryIO) -> dict:
+        """ Read the records from f as JSON
+        """
+        return json.loads(f.read())
+
+
+class MarshalSerializer(Serializer):
+    """ Standard library marshal: binary, fast, no dependency, but only
+    meant to be read back by the same Python version
+    """
+    name = "marshal"
+    extension = "marshal"
+
+    def dump(self, objs_json: dict, f: BinaryIO, cache: dict = None):
+        """ Write the records to f with marshal
+        """
+        f.write(marshal.dumps(objs_json))
+
+    def load(self, f: BinaryIO) -> dict:
+        """ Read the records from f with marshal
+        """
+        return marshal.loads(f.read())
+
+
+class MsgpackSerializer(Serializer):
+    """ MessagePack: binary and fast, needs the msgpack package
+    """
+    name = "msgpack"
+    extension = "msgpack"
+
+    def dump(self, objs_json: dict, f: BinaryIO, cache: dict = None):
+        """ Write the records to f with msgpack
+        """
+        if msgpack is None:
+            raise ImportError("the msgpack serializer needs msgpack")
+        msgpack.pack(objs_json, f)
+
+    def load(self, f: BinaryIO) -> dict:
+        """ Read the records from f with msgpack
+        """
+        if msgpack is None:
+            raise ImportError("the msgpack serializer needs msgpack")
+        return msgpack.unpackb(f.read(), raw=False)
+
+
+SERIALIZERS = {
+    serializer.name: serializer
+    for serializer in (JSONSerializer(), MarshalSerializer(),
+                       MsgpackSerializer())
+}
+
+
+def get_serializer(name: str) -> Serializer:
+    """ Return the serializer called name
+    """
+    if name not in SERIALIZERS:
+        raise ValueError("unknown serializer {}".format(name))
+    return SERIALIZERS[name]
@@ -2,12 +2,16 @@
 """ User module
 """
 import hashlib
-from models.base import Base
+from models.base import Base, COMPACT_MODELS
 
 
 class User(Base):
     """ User class
     """
+    __slots__ = ('email', '_password', 'first_name', 'last_name') \
+        if COMPACT_MODELS else ()
+    indexed_attributes = ('email',)
+    sorted_attributes = ('created_at', 'updated_at', 'email', 'last_name')
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
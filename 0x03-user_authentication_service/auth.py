@@ -6,9 +6,15 @@ import bcrypt
 from db import DB
 from user import User
 from sqlalchemy.orm.exc import NoResultFound
+import os
+import time
 import uuid
 from typing import Optional
 
+BCRYPT_BUDGET_MS = float(os.getenv('BCRYPT_BUDGET_MS', 100))
+BCRYPT_MIN_ROUNDS = int(os.getenv('BCRYPT_MIN_ROUNDS', 12))
+_bcrypt_rounds = None
+
 
 class Auth:
     """Auth class to interact with the authentication database.
@@ -35,6 +41,9 @@ class Auth:
         try:
             user = self._db.find_user_by(email=email)
             if bcrypt.checkpw(password.encode('utf-8'), user.hashed_password):
+                if _needs_rehash(user.hashed_password):
+                    self._db.update_user(
+                        user.id, hashed_password=_hash_password(password))
                 return True
             else:
                 return False
@@ -106,11 +115,50 @@ class Auth:
                              reset_token=None)
 
 
+def _calibrate_rounds(budget_ms: float = BCRYPT_BUDGET_MS) -> int:
+    """
+    Return the highest bcrypt cost whose hash takes at most budget_ms on
+    this host (never less than BCRYPT_MIN_ROUNDS)
+    """
+    rounds = 4
+    while rounds < 31:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds))
+        if (time.perf_counter() - start) * 2e3 > budget_ms:
+            break
+        rounds += 1
+    return max(rounds, BCRYPT_MIN_ROUNDS)
+
+
+def _target_rounds() -> int:
+    """
+    Return BCRYPT_ROUNDS if set, else the cost calibrated once per process
+    (set BCRYPT_ROUNDS to give every worker process the same target)
+    """
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        configured = os.getenv('BCRYPT_ROUNDS')
+        _bcrypt_rounds = int(configured) if configured \
+            else _calibrate_rounds()
+    return _bcrypt_rounds
+
+
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """
+    Tell whether a stored hash was made with a lower cost than the target
+    (a higher cost is kept, never downgraded)
+    """
+    if isinstance(hashed_password, str):
+        hashed_password = hashed_password.encode('utf-8')
+    return int(hashed_password.split(b"$")[2]) < _target_rounds()
+
+
 def _hash_password(password: str) -> bytes:
     """
     Hashes a password using bcrypt hashing algorithm
     """
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password.encode('utf-8'),
+                           bcrypt.gensalt(_target_rounds()))
     return hashed
 
 